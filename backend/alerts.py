@@ -0,0 +1,145 @@
+from datetime import date, timedelta
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from changelog import current_watermark
+from database import db
+from models import Student, Attendance, ChangeLog, SyncCursor, AbsenceStreak
+
+# Current absence streaks are kept in absence_streak and brought up to date from the
+# change log, so daily alerts only re-read the recent days of students whose
+# attendance changed instead of everyone's full history.
+CURSOR = 'absence_streaks'
+
+def _days(student_ids=None, since=None):
+    # One row per (student, marked day): whether every record that day was Absent
+    query = (
+        db.select(
+            Attendance.student_id,
+            Attendance.date,
+            func.min(case((Attendance.status == 'Absent', 1), else_=0)).label('absent')
+        )
+        .group_by(Attendance.student_id, Attendance.date)
+        .order_by(Attendance.student_id, Attendance.date)
+    )
+    if student_ids is not None:
+        query = query.where(Attendance.student_id.in_(student_ids))
+    if since is not None:
+        query = query.where(Attendance.date >= since)
+    return db.session.execute(query)
+
+def _streaks(days):
+    # Single pass over date-ordered days; a marked non-absent day resets the streak
+    state = {}
+    for student_id, day, absent in days:
+        streak, start, _ = state.get(student_id, (0, None, None))
+        state[student_id] = (streak + 1, start or day, day) if absent else (0, None, day)
+    return state
+
+def _store(state, student_ids):
+    db.session.execute(db.delete(AbsenceStreak).where(AbsenceStreak.student_id.in_(student_ids)))
+    if state:
+        db.session.execute(db.insert(AbsenceStreak), [
+            {'student_id': student_id, 'streak': streak, 'streak_start': start, 'last_date': last}
+            for student_id, (streak, start, last) in state.items()
+        ])
+
+def refresh_streaks():
+    watermark = current_watermark()
+    cursor = db.session.get(SyncCursor, CURSOR)
+
+    if cursor is None:
+        state = _streaks(_days())
+        db.session.execute(db.delete(AbsenceStreak))
+        _store(state, list(state))
+        db.session.add(SyncCursor(name=CURSOR, position=watermark))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker built them at the same time; carry on from its cursor
+            db.session.rollback()
+            return refresh_streaks()
+        return
+
+    if watermark <= cursor.position:
+        return
+
+    changes = db.session.execute(
+        db.select(ChangeLog.operation, ChangeLog.snapshot)
+        .where(ChangeLog.entity == 'attendance', ChangeLog.id > cursor.position, ChangeLog.id <= watermark)
+    ).all()
+    earliest = {}
+    for operation, row in changes:
+        changed = date.fromisoformat(row['date'])
+        # An update may have moved the record off an older date we can no longer see
+        earliest[row['student_id']] = min(earliest.get(row['student_id'], changed), date.min if operation == 'update' else changed)
+
+    if earliest:
+        known = {s.student_id: s for s in AbsenceStreak.query.filter(AbsenceStreak.student_id.in_(list(earliest)))}
+        bounded, full = {}, []
+        for student_id, changed in earliest.items():
+            current = known.get(student_id)
+            # Days before the current streak (or before the last non-absent day) can't be
+            # affected by changes after it, so only those recent days are re-read
+            lower = current and (current.streak_start if current.streak else current.last_date)
+            if lower and (changed >= lower if current.streak else changed > lower):
+                bounded[student_id] = lower
+            else:
+                full.append(student_id)
+
+        state = {}
+        if bounded:
+            days = [d for d in _days(list(bounded), since=min(bounded.values())) if d.date >= bounded[d.student_id]]
+            state.update(_streaks(days))
+        if full:
+            state.update(_streaks(_days(full)))
+        _store(state, list(earliest))
+
+    cursor.position = watermark
+    db.session.commit()
+
+def absence_alerts(streak_threshold, window_days, rate_threshold, class_name=None, as_of=None):
+    refresh_streaks()
+    as_of = as_of or date.today()
+    window_start = as_of - timedelta(days=window_days - 1)
+
+    window = {row.student_id: row for row in db.session.execute(
+        db.select(
+            Attendance.student_id,
+            func.count(Attendance.id).label('total'),
+            func.sum(case((Attendance.status == 'Present', 1), else_=0)).label('present')
+        )
+        .where(Attendance.date.between(window_start, as_of))
+        .group_by(Attendance.student_id)
+    )}
+
+    query = (
+        db.select(Student.id, Student.student_id, Student.name, Student.class_name,
+                  AbsenceStreak.streak, AbsenceStreak.streak_start)
+        .outerjoin(AbsenceStreak, AbsenceStreak.student_id == Student.id)
+        .order_by(Student.class_name, Student.name)
+    )
+    if class_name:
+        query = query.where(Student.class_name == class_name)
+
+    result = []
+    for student in db.session.execute(query):
+        counts = window.get(student.id)
+        rate = round(counts.present / counts.total * 100, 2) if counts and counts.total else None
+        reasons = []
+        if (student.streak or 0) >= streak_threshold:
+            reasons.append('absence_streak')
+        if rate is not None and rate < rate_threshold:
+            reasons.append('low_attendance_rate')
+        if reasons:
+            result.append({
+                'student_id': student.student_id,
+                'student_name': student.name,
+                'class_name': student.class_name,
+                'absence_streak': student.streak or 0,
+                'streak_start': student.streak_start.isoformat() if student.streak_start else None,
+                'window_total': counts.total if counts else 0,
+                'window_present': counts.present if counts else 0,
+                'window_rate': rate,
+                'reasons': reasons
+            })
+    return result
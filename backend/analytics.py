@@ -0,0 +1,133 @@
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import case, cast, func
+from archive import archived_rows
+from database import db
+from models import Student, Attendance, Grade
+
+BUCKETS = ('day', 'week', 'month')
+TREND_GROUPS = {'class_name': Student.class_name, 'subject': Attendance.subject}
+
+def date_bucket(column, bucket):
+    # First day of the day/week/month containing column, computed in the database
+    if bucket == 'day':
+        return column
+    if db.engine.dialect.name == 'postgresql':
+        return cast(func.date_trunc(bucket, column), db.Date)
+    if bucket == 'week':
+        return func.date(column, 'weekday 0', '-6 days')
+    return func.strftime('%Y-%m-01', column)
+
+def python_bucket(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+def attendance_trend(bucket, group_by, start_date=None, end_date=None, class_name=None, subject=None):
+    period = date_bucket(Attendance.date, bucket).label('period')
+    groups = [TREND_GROUPS[name].label(name) for name in group_by]
+
+    query = (
+        db.select(
+            period,
+            *groups,
+            func.count(Attendance.id).label('total'),
+            func.sum(case((Attendance.status == 'Present', 1), else_=0)).label('present'),
+            func.sum(case((Attendance.status == 'Late', 1), else_=0)).label('late'),
+            func.sum(case((Attendance.status == 'Absent', 1), else_=0)).label('absent')
+        )
+        .join(Student, Student.id == Attendance.student_id)
+        .group_by(period, *groups)
+    )
+    if start_date:
+        query = query.filter(Attendance.date >= start_date)
+    if end_date:
+        query = query.filter(Attendance.date <= end_date)
+    if class_name:
+        query = query.filter(Student.class_name == class_name)
+    if subject:
+        query = query.filter(Attendance.subject == subject)
+
+    counts = defaultdict(lambda: {'total': 0, 'present': 0, 'late': 0, 'absent': 0})
+    for row in db.session.execute(query):
+        key = (_iso(row.period),) + tuple(getattr(row, name) for name in group_by)
+        for field in ('total', 'present', 'late', 'absent'):
+            counts[key][field] += getattr(row, field)
+
+    # Archived terms are bucketed here; only reached when start_date goes back that far
+    if start_date:
+        classes = dict(db.session.execute(db.select(Student.id, Student.class_name)).all())
+        for row in archived_rows('attendance', start_date, end_date):
+            row_class = classes.get(row['student_id'])
+            if row_class is None or (class_name and row_class != class_name) or (subject and row['subject'] != subject):
+                continue
+            values = {'class_name': row_class, 'subject': row['subject']}
+            key = (python_bucket(row['date'], bucket).isoformat(),) + tuple(values[name] for name in group_by)
+            counts[key]['total'] += 1
+            if row['status'] in ('Present', 'Late', 'Absent'):
+                counts[key][row['status'].lower()] += 1
+
+    result = []
+    for key in sorted(counts):
+        entry = {'period': key[0], **dict(zip(group_by, key[1:])), **counts[key]}
+        entry['attendance_rate'] = round(entry['present'] / entry['total'] * 100, 2) if entry['total'] else 0
+        result.append(entry)
+    return result
+
+def school_summary(start_date=None, end_date=None):
+    # Raw totals for the current school's database; the district routes add them up across schools
+    attendance = db.select(
+        func.count(Attendance.id),
+        func.coalesce(func.sum(case((Attendance.status == 'Present', 1), else_=0)), 0)
+    )
+    grades = db.select(
+        func.count(Grade.id),
+        func.coalesce(func.sum(case((Grade.max_score > 0, Grade.score / Grade.max_score * 100), else_=0)), 0)
+    )
+    if start_date:
+        attendance = attendance.filter(Attendance.date >= start_date)
+        grades = grades.filter(Grade.date >= start_date)
+    if end_date:
+        attendance = attendance.filter(Attendance.date <= end_date)
+        grades = grades.filter(Grade.date <= end_date)
+
+    total, present = db.session.execute(attendance).one()
+    assignments, percentage_sum = db.session.execute(grades).one()
+    return {
+        'students': db.session.execute(db.select(func.count(Student.id))).scalar(),
+        'attendance_records': total,
+        'present_count': present,
+        'grades': assignments,
+        'percentage_sum': float(percentage_sum)
+    }
+
+def summary_rates(totals):
+    return {
+        'students': totals['students'],
+        'attendance_records': totals['attendance_records'],
+        'attendance_rate': round(totals['present_count'] / totals['attendance_records'] * 100, 2) if totals['attendance_records'] else 0,
+        'grades': totals['grades'],
+        'average_grade': round(totals['percentage_sum'] / totals['grades'], 2) if totals['grades'] else None
+    }
+
+def merge_trends(trends, group_by):
+    # trends: {school: attendance_trend(...) rows}; 'school' in group_by keeps schools apart
+    counts = defaultdict(lambda: {'total': 0, 'present': 0, 'late': 0, 'absent': 0})
+    for school, rows in trends.items():
+        for row in rows:
+            values = {**row, 'school': school}
+            key = (row['period'],) + tuple(values[name] for name in group_by)
+            for field in ('total', 'present', 'late', 'absent'):
+                counts[key][field] += row[field]
+
+    result = []
+    for key in sorted(counts, key=lambda key: tuple('' if part is None else part for part in key)):
+        entry = {'period': key[0], **dict(zip(group_by, key[1:])), **counts[key]}
+        entry['attendance_rate'] = round(entry['present'] / entry['total'] * 100, 2) if entry['total'] else 0
+        result.append(entry)
+    return result
@@ -1,91 +1,57 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from database import db
-from models import User, Role, Permission, Student, Attendance, Grade
+from database import PerSchool, current_school, db
+from models import EMAIL_PATTERN, User, Role, Student, Attendance, Grade, Term
+from changelog import changes_since, current_watermark, log_student_deletes, student_lookup
 from auth import Auth, token_required, permission_required, admin_required
+from alerts import absence_alerts
+from analytics import BUCKETS, TREND_GROUPS, attendance_trend, merge_trends, school_summary, summary_rates
+from archive import archive_term, archived_rows, reaches_archive
+from bootstrap import bootstrap, is_bootstrapped
+from columnar import ColumnarStore, np
+from grading import CATEGORY_NAMES, current_term, reset_totals, set_weights, term_grades, weights
+from json_provider import FastJSONProvider
+from limits import Limiter, concurrency_limited, release_after, too_many_requests
+from lookups import STATUSES
+from overview import StudentOverviews
+from rankings import GradeRankings
+from reports import read_report, start_reports
+from stream import AttendanceFeed
+from sync import SyncError, sync
+from tenants import fan_out, school_binds, school_context, school_dir, select_school
 from datetime import datetime
+from io import StringIO
+from sqlalchemy.exc import IntegrityError
+import csv
+import json
 import os
+import threading
+import time
+
+REGISTER_CODES = {'Present': 'P', 'Absent': 'A', 'Late': 'L', None: '-'}
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object('config.Config')
+    app.config['SQLALCHEMY_BINDS'] = school_binds(app.config)
+    if app.config['FAST_JSON']:
+        app.json = FastJSONProvider(app)
     
     db.init_app(app)
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
-    
-    def seed_initial_data():
-        permissions_data = {
-            'admin': 'Full system access',
-            'manage_students': 'Add, edit, and delete students',
-            'manage_attendance': 'Mark and manage attendance',
-            'manage_grades': 'Add and manage grades',
-            'view_data': 'View all data',
-            'view_analytics': 'Access analytics and reports'
-        }
-        
-        for perm_name, description in permissions_data.items():
-            if not Permission.query.filter_by(name=perm_name).first():
-                permission = Permission(name=perm_name, description=description)
-                db.session.add(permission)
-        
-        db.session.commit()
-        
-        roles_data = {
-            'admin': ['admin', 'manage_students', 'manage_attendance', 'manage_grades', 'view_data', 'view_analytics'],
-            'teacher': ['manage_students', 'manage_attendance', 'manage_grades', 'view_data', 'view_analytics'],
-            'viewer': ['view_data', 'view_analytics']
-        }
-        
-        for role_name, perm_names in roles_data.items():
-            role = Role.query.filter_by(name=role_name).first()
-            if not role:
-                role = Role(name=role_name, description=f'{role_name.title()} role')
-                db.session.add(role)
-                db.session.flush()
-            
-            for perm_name in perm_names:
-                permission = Permission.query.filter_by(name=perm_name).first()
-                if permission and permission not in role.permissions:
-                    role.permissions.append(permission)
-        
-        db.session.commit()
-        
-        if not User.query.filter_by(username='admin').first():
-            admin_role = Role.query.filter_by(name='admin').first()
-            admin_user = User(
-                username='admin',
-                email='admin@school.edu',
-                role_id=admin_role.id
-            )
-            admin_user.set_password('admin123')
-            db.session.add(admin_user)
-        
-        if not User.query.filter_by(username='teacher').first():
-            teacher_role = Role.query.filter_by(name='teacher').first()
-            teacher_user = User(
-                username='teacher',
-                email='teacher@school.edu',
-                role_id=teacher_role.id
-            )
-            teacher_user.set_password('teacher123')
-            db.session.add(teacher_user)
-        
-        if not User.query.filter_by(username='viewer').first():
-            viewer_role = Role.query.filter_by(name='viewer').first()
-            viewer_user = User(
-                username='viewer',
-                email='viewer@school.edu',
-                role_id=viewer_role.id
-            )
-            viewer_user.set_password('viewer123')
-            db.session.add(viewer_user)
-        
-        db.session.commit()
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=['X-Watermark', 'Retry-After'])
+    if app.config['LIMITS_ENABLED']:
+        Limiter(app)
+    app.before_request(select_school)
     
-    # Initialize database and seed data
+    for school in [None] + app.config['SCHOOLS']:
+        with school_context(app, school):
+            if app.config['AUTO_BOOTSTRAP'] and not is_bootstrapped():
+                bootstrap()
     with app.app_context():
-        db.create_all()
-        seed_initial_data()
+        # Don't hand pooled connections to forked workers when running under gunicorn --preload
+        for engine in db.engines.values():
+            engine.dispose()
     
     @app.route('/api/auth/register', methods=['POST'])
     @admin_required
@@ -108,9 +74,7 @@ def create_app():
             return jsonify({'message': 'Email already exists'}), 400
         
         # Email validation
-        import re
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, data['email']):
+        if not EMAIL_PATTERN.match(data['email']):
             return jsonify({'message': 'Invalid email format'}), 400
         
         # Password validation
@@ -135,9 +99,10 @@ def create_app():
         user = User.query.filter_by(username=data['username']).first()
         
         if user and user.check_password(data['password']):
-            token = Auth.generate_token(user.id, app.config['SECRET_KEY'])
+            token = Auth.generate_token(user.id, app.config['SECRET_KEY'], school=current_school.get())
             return jsonify({
                 'token': token,
+                'school': current_school.get(),
                 'user': {
                     'id': user.id,
                     'username': user.username,
@@ -152,14 +117,10 @@ def create_app():
     @app.route('/api/students', methods=['GET'])
     @token_required
     def get_students(current_user):
-        students = Student.query.all()
-        return jsonify([{
-            'id': s.id,
-            'student_id': s.student_id,
-            'name': s.name,
-            'email': s.email,
-            'class_name': s.class_name
-        } for s in students])
+        rows = db.session.execute(db.select(
+            Student.id, Student.student_id, Student.name, Student.email, Student.class_name
+        )).all()
+        return jsonify([row._asdict() for row in rows])
     
     @app.route('/api/students/<int:student_id>', methods=['GET'])
     @token_required
@@ -173,6 +134,17 @@ def create_app():
             'class_name': student.class_name
         })
     
+    student_overviews = PerSchool(lambda school: StudentOverviews())
+    
+    @app.route('/api/students/<int:student_id>/overview', methods=['GET'])
+    @token_required
+    def get_student_overview(current_user, student_id):
+        recent = min(max(request.args.get('recent', 10, type=int), 0), 50)
+        overview = student_overviews.current().get(student_id, recent)
+        if overview is None:
+            return jsonify({'message': 'Student not found'}), 404
+        return jsonify(overview)
+    
     @app.route('/api/students', methods=['POST'])
     @permission_required('manage_students')
     def create_student(current_user):
@@ -189,9 +161,7 @@ def create_app():
             return jsonify({'message': 'Email already exists'}), 400
         
         # Email validation
-        import re
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, data['email']):
+        if not EMAIL_PATTERN.match(data['email']):
             return jsonify({'message': 'Invalid email format'}), 400
         
         student = Student(
@@ -215,9 +185,7 @@ def create_app():
             if Student.query.filter_by(email=data['email']).first():
                 return jsonify({'message': 'Email already exists'}), 400
             # Email validation
-            import re
-            email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-            if not re.match(email_pattern, data['email']):
+            if not EMAIL_PATTERN.match(data['email']):
                 return jsonify({'message': 'Invalid email format'}), 400
         
         student.name = data.get('name', student.name)
@@ -231,14 +199,35 @@ def create_app():
     @permission_required('manage_students')
     def delete_student(current_user, student_id):
         student = Student.query.get_or_404(student_id)
-        db.session.delete(student)
+        log_student_deletes(Student.id == student.id)
+        db.session.execute(db.delete(Student).where(Student.id == student.id))
         db.session.commit()
         return jsonify({'message': 'Student deleted successfully'})
     
+    @app.route('/api/students', methods=['DELETE'])
+    @permission_required('manage_students')
+    @concurrency_limited('bulk_writes')
+    def bulk_delete_students(current_user):
+        class_name = request.args.get('class_name')
+        if not class_name:
+            return jsonify({'message': 'class_name is required'}), 400
+        
+        # Attendance and grades go with the students through ON DELETE CASCADE
+        log_student_deletes(Student.class_name == class_name)
+        result = db.session.execute(
+            db.delete(Student).where(Student.class_name == class_name),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        return jsonify({'message': f'Deleted {result.rowcount} students', 'deleted': result.rowcount})
+    
     @app.route('/api/attendance', methods=['POST'])
     @permission_required('manage_attendance')
     def mark_attendance(current_user):
         data = request.json
+        if data.get('status') not in STATUSES:
+            return jsonify({'message': f'status must be one of {", ".join(STATUSES)}'}), 400
+        
         attendance = Attendance(
             student_id=data['student_id'],
             date=datetime.strptime(data['date'], '%Y-%m-%d').date(),
@@ -253,13 +242,80 @@ def create_app():
     @app.route('/api/attendance/student/<int:student_id>', methods=['GET'])
     @token_required
     def get_student_attendance(current_user, student_id):
-        attendances = Attendance.query.filter_by(student_id=student_id).order_by(Attendance.date.desc()).all()
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        query = db.select(Attendance.id, Attendance.date, Attendance.status, Attendance.subject).filter_by(student_id=student_id)
+        if start_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            query = query.filter(Attendance.date >= start_date)
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            query = query.filter(Attendance.date <= end_date)
+        
+        rows = [row._asdict() for row in db.session.execute(query.order_by(Attendance.date.desc()))]
+        # Closed terms only live in the archive; read them when the range reaches back that far
+        if start_date:
+            rows = sorted(rows + archived_rows('attendance', start_date, end_date, student_id=student_id),
+                          key=lambda row: row['date'], reverse=True)
+        
         return jsonify([{
-            'id': a.id,
-            'date': a.date.isoformat(),
-            'status': a.status,
-            'subject': a.subject
-        } for a in attendances])
+            'id': row['id'],
+            'date': row['date'].isoformat(),
+            'status': row['status'],
+            'subject': row['subject']
+        } for row in rows])
+    
+    @app.route('/api/attendance/register', methods=['GET'])
+    @token_required
+    def get_attendance_register(current_user):
+        class_name = request.args.get('class_name')
+        subject = request.args.get('subject')
+        if not class_name or not subject:
+            return jsonify({'message': 'class_name and subject are required'}), 400
+        
+        today = datetime.utcnow().date()
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today.replace(day=1)
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+        
+        rows = db.session.execute(
+            db.select(Student.id, Student.student_id, Student.name, Attendance.date, Attendance.status)
+            .outerjoin(Attendance, db.and_(
+                Attendance.student_id == Student.id,
+                Attendance.subject == subject,
+                Attendance.date.between(start_date, end_date)
+            ))
+            .where(Student.class_name == class_name)
+            .order_by(Student.name, Student.id, Attendance.id)
+        ).all()
+        
+        students = {}
+        marks = {}
+        for id, code, name, date, status in rows:
+            students.setdefault(id, (code, name))
+            if date:
+                marks[(id, date)] = status
+        for row in archived_rows('attendance', start_date, end_date):
+            if row['student_id'] in students and row['subject'] == subject:
+                marks.setdefault((row['student_id'], row['date']), row['status'])
+        
+        # One character per date: P(resent), A(bsent), L(ate), '-' not marked
+        dates = sorted({date for _, date in marks})
+        return jsonify({
+            'class_name': class_name,
+            'subject': subject,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'dates': [date.isoformat() for date in dates],
+            'students': [{
+                'id': id,
+                'student_id': code,
+                'name': name,
+                'statuses': ''.join(REGISTER_CODES.get(marks.get((id, date)), '?') for date in dates)
+            } for id, (code, name) in students.items()]
+        })
     
     @app.route('/api/attendance/<int:attendance_id>', methods=['PUT'])
     @permission_required('manage_attendance')
@@ -270,6 +326,8 @@ def create_app():
         if 'date' in data:
             attendance.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
         if 'status' in data:
+            if data['status'] not in STATUSES:
+                return jsonify({'message': f'status must be one of {", ".join(STATUSES)}'}), 400
             attendance.status = data['status']
         if 'subject' in data:
             attendance.subject = data['subject']
@@ -287,6 +345,7 @@ def create_app():
     
     @app.route('/api/attendance/bulk', methods=['POST'])
     @permission_required('manage_attendance')
+    @concurrency_limited('bulk_writes')
     def bulk_mark_attendance(current_user):
         data = request.json
         date = datetime.strptime(data['date'], '%Y-%m-%d').date()
@@ -297,6 +356,9 @@ def create_app():
         errors = []
         
         for record in records:
+            if record.get('status') not in STATUSES:
+                errors.append({'student_id': record.get('student_id'), 'error': f'status must be one of {", ".join(STATUSES)}'})
+                continue
             try:
                 attendance = Attendance(
                     student_id=record['student_id'],
@@ -337,16 +399,33 @@ def create_app():
     @app.route('/api/grades/student/<int:student_id>', methods=['GET'])
     @token_required
     def get_student_grades(current_user, student_id):
-        grades = Grade.query.filter_by(student_id=student_id).order_by(Grade.date.desc()).all()
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        query = db.select(
+            Grade.id, Grade.subject, Grade.assignment, Grade.score, Grade.max_score, Grade.date
+        ).filter_by(student_id=student_id)
+        if start_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            query = query.filter(Grade.date >= start_date)
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            query = query.filter(Grade.date <= end_date)
+        
+        rows = [row._asdict() for row in db.session.execute(query.order_by(Grade.date.desc()))]
+        if start_date:
+            rows = sorted(rows + archived_rows('grade', start_date, end_date, student_id=student_id),
+                          key=lambda row: row['date'], reverse=True)
+        
         return jsonify([{
-            'id': g.id,
-            'subject': g.subject,
-            'assignment': g.assignment,
-            'score': g.score,
-            'max_score': g.max_score,
-            'percentage': round((g.score / g.max_score * 100), 2) if g.max_score > 0 else 0,
-            'date': g.date.isoformat()
-        } for g in grades])
+            'id': row['id'],
+            'subject': row['subject'],
+            'assignment': row['assignment'],
+            'score': row['score'],
+            'max_score': row['max_score'],
+            'percentage': round((row['score'] / row['max_score'] * 100), 2) if row['max_score'] > 0 else 0,
+            'date': row['date'].isoformat()
+        } for row in rows])
     
     @app.route('/api/grades/<int:grade_id>', methods=['PUT'])
     @permission_required('manage_grades')
@@ -376,13 +455,161 @@ def create_app():
         db.session.commit()
         return jsonify({'message': 'Grade deleted successfully'})
     
+    def requested_term():
+        # ?term_id=, else the current term; None means grades dated outside every term
+        term_id = request.args.get('term_id', type=int)
+        return Term.query.get_or_404(term_id) if term_id else current_term()
+    
+    def term_info(term):
+        return {'id': term.id, 'name': term.name} if term else None
+    
+    @app.route('/api/students/<int:student_id>/term-grades', methods=['GET'])
+    @token_required
+    def get_student_term_grades(current_user, student_id):
+        Student.query.get_or_404(student_id)
+        term = requested_term()
+        grades = term_grades([student_id], term and term.id)[student_id]
+        return jsonify({'term': term_info(term), **grades})
+    
+    @app.route('/api/analytics/term-grades')
+    @permission_required('view_analytics')
+    @concurrency_limited('analytics')
+    def term_grades_report(current_user):
+        term = requested_term()
+        query = db.select(Student.id, Student.student_id, Student.name, Student.class_name).order_by(Student.class_name, Student.name)
+        if request.args.get('class_name'):
+            query = query.where(Student.class_name == request.args['class_name'])
+        students = db.session.execute(query).all()
+        grades = term_grades([s.id for s in students], term and term.id)
+        return jsonify({
+            'term': term_info(term),
+            'students': [{
+                'student_id': s.student_id,
+                'student_name': s.name,
+                'class_name': s.class_name,
+                'gpa': grades[s.id]['gpa'],
+                'subjects': {subject['subject']: subject['grade'] for subject in grades[s.id]['subjects']}
+            } for s in students]
+        })
+    
+    @app.route('/api/grade-weights', methods=['GET'])
+    @permission_required('view_data')
+    def get_grade_weights(current_user):
+        stored = weights()
+        return jsonify({'categories': list(CATEGORY_NAMES), 'default': stored.pop(None), 'subjects': stored})
+    
+    @app.route('/api/grade-weights', methods=['PUT'])
+    @admin_required
+    def update_grade_weights(current_user):
+        data = request.json or {}
+        if not isinstance(data.get('weights'), dict):
+            return jsonify({'message': 'weights must map categories to weights'}), 400
+        try:
+            set_weights(data.get('subject'), data['weights'])
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        return jsonify({'message': 'Grade weights updated successfully'})
+    
+    @app.route('/api/sync', methods=['POST'])
+    @token_required
+    @concurrency_limited('bulk_writes')
+    def sync_changes(current_user):
+        try:
+            return jsonify(sync(current_user, request.json or {}))
+        except SyncError as e:
+            return jsonify({'message': str(e)}), 400
+        except IntegrityError:
+            # e.g. the same batch_id sent twice at once; the retry gets the stored results
+            db.session.rollback()
+            return jsonify({'message': 'Changes could not be applied; retry the sync'}), 409
+    
+    # Caches built from one database are kept per school
+    columnar_stores = None
+    if app.config['ANALYTICS_ENGINE'] == 'columnar':
+        if np is None:
+            app.logger.warning('ANALYTICS_ENGINE=columnar requires numpy; using SQL analytics')
+        else:
+            columnar_stores = PerSchool(lambda school: ColumnarStore(app))
+    
+    def current_columnar():
+        return columnar_stores.current() if columnar_stores else None
+    
+    attendance_feeds = PerSchool(lambda school: AttendanceFeed(app, school=school, poll_interval=app.config['STREAM_POLL_SECONDS']))
+    # Per worker process, whatever the school: each open stream holds one of its threads
+    stream_slots = threading.BoundedSemaphore(app.config['STREAM_SUBSCRIBERS'])
+    
+    @app.route('/api/stream/attendance')
+    @token_required
+    def stream_attendance(current_user):
+        class_name = request.args.get('class_name')
+        subject = request.args.get('subject')
+        
+        if not stream_slots.acquire(blocking=False):
+            return too_many_requests('Too many open streams on this server', 15)
+        try:
+            attendance_feed = attendance_feeds.current()
+            attendance_feed.ensure_started()
+        except BaseException:
+            stream_slots.release()
+            raise
+        progress = attendance_feed.progress(class_name)
+        cursor = attendance_feed.latest
+        last_event_id = request.headers.get('Last-Event-ID')
+        if last_event_id and last_event_id.isdigit():
+            cursor = min(int(last_event_id), cursor)
+        
+        def generate():
+            nonlocal cursor
+            yield f'event: progress\ndata: {json.dumps(progress)}\n\n'
+            while True:
+                events, cursor, behind = attendance_feed.wait(cursor, timeout=15)
+                if behind:
+                    # Too far behind the buffer; the client should refetch and resubscribe
+                    yield f'id: {cursor}\nevent: reset\ndata: {{}}\n\n'
+                    continue
+                sent = False
+                for event in events:
+                    if class_name and event.class_name != class_name:
+                        continue
+                    if subject and event.subject != subject:
+                        continue
+                    yield f'id: {event.seq}\ndata: {event.payload}\n\n'
+                    sent = True
+                if not sent:
+                    yield ': keepalive\n\n'
+        
+        return release_after(Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }), stream_slots.release)
+    
     @app.route('/api/analytics/attendance-summary')
     @permission_required('view_analytics')
+    @concurrency_limited('analytics')
     def attendance_summary(current_user):
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         subject = request.args.get('subject')
         
+        columnar = current_columnar()
+        if columnar and not reaches_archive(start_date and datetime.strptime(start_date, '%Y-%m-%d').date()):
+            students = db.session.execute(db.select(Student.id, Student.student_id, Student.name, Student.class_name)).all()
+            columnar.refresh()
+            total, present = columnar.attendance_counts(
+                start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+                end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+                subject=subject,
+                size=max((s.id for s in students), default=0) + 1
+            )
+            return jsonify([{
+                'student_id': s.student_id,
+                'student_name': s.name,
+                'class_name': s.class_name,
+                'total_classes': int(total[s.id]),
+                'present_count': int(present[s.id]),
+                'attendance_rate': round(present[s.id] / total[s.id] * 100, 2) if total[s.id] > 0 else 0
+            } for s in students])
+        
         students = Student.query.all()
         result = []
         
@@ -412,13 +639,139 @@ def create_app():
         
         return jsonify(result)
     
+    @app.route('/api/analytics/attendance-trend')
+    @permission_required('view_analytics')
+    @concurrency_limited('analytics')
+    def attendance_trend_report(current_user):
+        bucket = request.args.get('bucket', 'week')
+        group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        if bucket not in BUCKETS:
+            return jsonify({'message': f'bucket must be one of: {", ".join(BUCKETS)}'}), 400
+        if any(name not in TREND_GROUPS for name in group_by):
+            return jsonify({'message': f'group_by accepts: {", ".join(TREND_GROUPS)}'}), 400
+        
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        
+        engine = attendance_trend
+        columnar = current_columnar()
+        if columnar and not reaches_archive(start_date):
+            columnar.refresh()
+            engine = columnar.attendance_trend
+        
+        return jsonify(engine(
+            bucket,
+            group_by,
+            start_date=start_date,
+            end_date=end_date,
+            class_name=request.args.get('class_name'),
+            subject=request.args.get('subject')
+        ))
+    
+    @app.route('/api/analytics/absence-alerts')
+    @permission_required('view_analytics')
+    @concurrency_limited('analytics')
+    def absence_alerts_report(current_user):
+        try:
+            streak = int(request.args.get('streak', 3))
+            window_days = int(request.args.get('window_days', 30))
+            min_rate = float(request.args.get('min_rate', 75))
+        except ValueError:
+            return jsonify({'message': 'streak, window_days and min_rate must be numbers'}), 400
+        
+        if streak < 1 or window_days < 1:
+            return jsonify({'message': 'streak and window_days must be at least 1'}), 400
+        
+        as_of = request.args.get('as_of')
+        return jsonify(absence_alerts(
+            streak,
+            window_days,
+            min_rate,
+            class_name=request.args.get('class_name'),
+            as_of=datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else None
+        ))
+    
+    grade_rankings = PerSchool(lambda school: GradeRankings())
+    
+    @app.route('/api/analytics/grade-rankings')
+    @permission_required('view_analytics')
+    @concurrency_limited('analytics')
+    def grade_rankings_report(current_user):
+        return jsonify(grade_rankings.current().get(
+            class_name=request.args.get('class_name'),
+            subject=request.args.get('subject')
+        ))
+    
+    @app.route('/api/reports', methods=['POST'])
+    @permission_required('view_analytics')
+    def create_report(current_user):
+        data = request.json or {}
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        
+        class_names = data.get('class_names') or db.session.execute(
+            db.select(Student.class_name).distinct().order_by(Student.class_name)
+        ).scalars().all()
+        if not class_names:
+            return jsonify({'message': 'No classes to report on'}), 400
+        
+        run_id, started = start_reports(
+            school_dir(app.config['REPORTS_DIR']),
+            class_names,
+            start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+            end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            workers=app.config['REPORT_WORKERS'],
+            school=current_school.get()
+        )
+        if not started:
+            return jsonify({'message': 'A report is already being generated; wait for it to finish', 'id': run_id}), 409
+        return jsonify({'message': 'Report generation started', 'id': run_id}), 202
+    
+    @app.route('/api/reports/<run_id>')
+    @permission_required('view_analytics')
+    def get_report(current_user, run_id):
+        index = read_report(school_dir(app.config['REPORTS_DIR']), run_id)
+        if index is None:
+            return jsonify({'message': 'Report not found'}), 404
+        return jsonify(index)
+    
+    @app.route('/api/reports/<run_id>/classes/<class_name>')
+    @permission_required('view_analytics')
+    def get_class_report(current_user, run_id, class_name):
+        index = read_report(school_dir(app.config['REPORTS_DIR']), run_id)
+        if index is None or class_name not in index['classes']:
+            return jsonify({'message': 'Report not found'}), 404
+        return jsonify(read_report(school_dir(app.config['REPORTS_DIR']), run_id, index['classes'][class_name]['file']))
+    
     @app.route('/api/analytics/grades-summary')
     @permission_required('view_analytics')
+    @concurrency_limited('analytics')
     def grades_summary(current_user):
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         subject = request.args.get('subject')
         
+        columnar = current_columnar()
+        if columnar and not reaches_archive(start_date and datetime.strptime(start_date, '%Y-%m-%d').date()):
+            students = db.session.execute(db.select(Student.id, Student.student_id, Student.name, Student.class_name)).all()
+            columnar.refresh()
+            count, percentage_sum = columnar.grade_averages(
+                start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+                end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+                subject=subject,
+                size=max((s.id for s in students), default=0) + 1
+            )
+            return jsonify([{
+                'student_id': s.student_id,
+                'student_name': s.name,
+                'class_name': s.class_name,
+                'total_assignments': int(count[s.id]),
+                'average_grade': round(float(percentage_sum[s.id] / count[s.id]), 2)
+            } for s in students if count[s.id]])
+        
         students = Student.query.all()
         result = []
         
@@ -447,12 +800,46 @@ def create_app():
         
         return jsonify(result)
     
+    def export_changes(entity, filename, header, to_csv):
+        # Rows changed after the client's watermark, in the export's column layout plus
+        # a trailing Change column; the watermark to send next time is in X-Watermark
+        try:
+            since = int(request.args['since'])
+        except ValueError:
+            return jsonify({'message': 'since must be a watermark returned by a previous export'}), 400
+        
+        watermark = current_watermark()
+        changes = changes_since(entity, since, watermark)
+        students = student_lookup({row['student_id'] for _, row in changes}) if entity != 'student' else {}
+        
+        def generate():
+            output = StringIO()
+            writer = csv.writer(output)
+            writer.writerow(header + ['Change'])
+            for operation, row in changes:
+                writer.writerow(to_csv(row, students) + [operation])
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+            if output.tell():
+                yield output.getvalue()
+        
+        return Response(
+            generate(),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}', 'X-Watermark': str(watermark)}
+        )
+    
     @app.route('/api/export/students', methods=['GET'])
     @permission_required('view_data')
+    @concurrency_limited('exports')
     def export_students(current_user):
+        if request.args.get('since'):
+            return export_changes('student', 'students.csv', ['Student ID', 'Name', 'Email', 'Class'],
+                                  lambda row, students: [row['student_id'], row['name'], row['email'], row['class_name']])
+        
+        watermark = current_watermark()
         students = Student.query.all()
-        import csv
-        from io import StringIO
         
         output = StringIO()
         writer = csv.writer(output)
@@ -461,71 +848,183 @@ def create_app():
         for student in students:
             writer.writerow([student.student_id, student.name, student.email, student.class_name])
         
-        from flask import Response
         return Response(
             output.getvalue(),
             mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=students.csv'}
+            headers={'Content-Disposition': 'attachment; filename=students.csv', 'X-Watermark': str(watermark)}
         )
     
     @app.route('/api/export/attendance', methods=['GET'])
     @permission_required('view_data')
+    @concurrency_limited('exports')
     def export_attendance(current_user):
-        attendances = Attendance.query.order_by(Attendance.date.desc()).all()
-        import csv
-        from io import StringIO
+        if request.args.get('since'):
+            return export_changes('attendance', 'attendance.csv', ['Date', 'Student ID', 'Student Name', 'Subject', 'Status'],
+                                  lambda row, students: [
+                                      row['date'],
+                                      *students.get(row['student_id'], ('', '')),
+                                      row['subject'],
+                                      row['status']
+                                  ])
+        
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        watermark = current_watermark()
+        query = db.select(Attendance.date, Attendance.student_id, Attendance.subject, Attendance.status)
+        if start_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            query = query.filter(Attendance.date >= start_date)
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            query = query.filter(Attendance.date <= end_date)
+        
+        attendances = [row._asdict() for row in db.session.execute(query.order_by(Attendance.date.desc()))]
+        if start_date:
+            attendances = sorted(attendances + archived_rows('attendance', start_date, end_date),
+                                 key=lambda row: row['date'], reverse=True)
+        students = {s.id: s for s in db.session.execute(db.select(Student.id, Student.student_id, Student.name))}
         
         output = StringIO()
         writer = csv.writer(output)
         writer.writerow(['Date', 'Student ID', 'Student Name', 'Subject', 'Status'])
         
         for attendance in attendances:
+            student = students.get(attendance['student_id'])
+            if not student:
+                continue
             writer.writerow([
-                attendance.date.isoformat(),
-                attendance.student.student_id,
-                attendance.student.name,
-                attendance.subject,
-                attendance.status
+                attendance['date'].isoformat(),
+                student.student_id,
+                student.name,
+                attendance['subject'],
+                attendance['status']
             ])
         
-        from flask import Response
         return Response(
             output.getvalue(),
             mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=attendance.csv'}
+            headers={'Content-Disposition': 'attachment; filename=attendance.csv', 'X-Watermark': str(watermark)}
         )
     
     @app.route('/api/export/grades', methods=['GET'])
     @permission_required('view_data')
+    @concurrency_limited('exports')
     def export_grades(current_user):
-        grades = Grade.query.order_by(Grade.date.desc()).all()
-        import csv
-        from io import StringIO
+        if request.args.get('since'):
+            return export_changes('grade', 'grades.csv', ['Date', 'Student ID', 'Student Name', 'Subject', 'Assignment', 'Score', 'Max Score', 'Percentage'],
+                                  lambda row, students: [
+                                      row['date'],
+                                      *students.get(row['student_id'], ('', '')),
+                                      row['subject'],
+                                      row['assignment'],
+                                      row['score'],
+                                      row['max_score'],
+                                      round((row['score'] / row['max_score'] * 100), 2) if row['max_score'] > 0 else 0
+                                  ])
+        
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        watermark = current_watermark()
+        query = db.select(Grade.date, Grade.student_id, Grade.subject, Grade.assignment, Grade.score, Grade.max_score)
+        if start_date:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            query = query.filter(Grade.date >= start_date)
+        if end_date:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+            query = query.filter(Grade.date <= end_date)
+        
+        grades = [row._asdict() for row in db.session.execute(query.order_by(Grade.date.desc()))]
+        if start_date:
+            grades = sorted(grades + archived_rows('grade', start_date, end_date),
+                            key=lambda row: row['date'], reverse=True)
+        students = {s.id: s for s in db.session.execute(db.select(Student.id, Student.student_id, Student.name))}
         
         output = StringIO()
         writer = csv.writer(output)
         writer.writerow(['Date', 'Student ID', 'Student Name', 'Subject', 'Assignment', 'Score', 'Max Score', 'Percentage'])
         
         for grade in grades:
-            percentage = round((grade.score / grade.max_score * 100), 2) if grade.max_score > 0 else 0
+            student = students.get(grade['student_id'])
+            if not student:
+                continue
+            percentage = round((grade['score'] / grade['max_score'] * 100), 2) if grade['max_score'] > 0 else 0
             writer.writerow([
-                grade.date.isoformat(),
-                grade.student.student_id,
-                grade.student.name,
-                grade.subject,
-                grade.assignment,
-                grade.score,
-                grade.max_score,
+                grade['date'].isoformat(),
+                student.student_id,
+                student.name,
+                grade['subject'],
+                grade['assignment'],
+                grade['score'],
+                grade['max_score'],
                 percentage
             ])
         
-        from flask import Response
         return Response(
             output.getvalue(),
             mimetype='text/csv',
-            headers={'Content-Disposition': 'attachment; filename=grades.csv'}
+            headers={'Content-Disposition': 'attachment; filename=grades.csv', 'X-Watermark': str(watermark)}
         )
     
+    @app.route('/api/terms', methods=['GET'])
+    @token_required
+    def get_terms(current_user):
+        terms = Term.query.order_by(Term.start_date.desc()).all()
+        return jsonify([{
+            'id': t.id,
+            'name': t.name,
+            'start_date': t.start_date.isoformat(),
+            'end_date': t.end_date.isoformat(),
+            'archived_at': t.archived_at.isoformat() if t.archived_at else None
+        } for t in terms])
+    
+    @app.route('/api/terms', methods=['POST'])
+    @admin_required
+    def create_term(current_user):
+        data = request.json
+        
+        if not data.get('name') or not data.get('start_date') or not data.get('end_date'):
+            return jsonify({'message': 'Name, start_date and end_date are required'}), 400
+        
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date()
+        if end_date < start_date:
+            return jsonify({'message': 'end_date must not be before start_date'}), 400
+        
+        if Term.query.filter_by(name=data['name']).first():
+            return jsonify({'message': 'Term already exists'}), 400
+        
+        if Term.query.filter(Term.start_date <= end_date, Term.end_date >= start_date).first():
+            return jsonify({'message': 'Term overlaps an existing term'}), 400
+        
+        term = Term(name=data['name'], start_date=start_date, end_date=end_date)
+        db.session.add(term)
+        # Grades already dated inside the new term move into it
+        reset_totals()
+        db.session.commit()
+        return jsonify({'message': 'Term created successfully', 'id': term.id}), 201
+    
+    @app.route('/api/terms/<int:term_id>/archive', methods=['POST'])
+    @admin_required
+    def archive_term_data(current_user, term_id):
+        term = Term.query.get_or_404(term_id)
+        
+        if term.archived_at:
+            return jsonify({'message': 'Term is already archived'}), 400
+        
+        if term.end_date >= datetime.utcnow().date():
+            return jsonify({'message': 'Only closed terms can be archived'}), 400
+        
+        counts = archive_term(term)
+        columnar = current_columnar()
+        if columnar:
+            columnar.invalidate()
+        return jsonify({
+            'message': f'Archived {counts["attendance"]} attendance records and {counts["grade"]} grades',
+            'archived': counts
+        })
+    
     @app.route('/api/users', methods=['GET'])
     @admin_required
     def get_users(current_user):
@@ -559,9 +1058,7 @@ def create_app():
             if User.query.filter_by(email=data['email']).first():
                 return jsonify({'message': 'Email already exists'}), 400
             # Email validation
-            import re
-            email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-            if not re.match(email_pattern, data['email']):
+            if not EMAIL_PATTERN.match(data['email']):
                 return jsonify({'message': 'Invalid email format'}), 400
             user.email = data['email']
         
@@ -601,6 +1098,85 @@ def create_app():
             'permissions': [p.name for p in r.permissions]
         } for r in roles])
     
+    # District analytics: query every school's database in parallel and merge the results
+    def district_error():
+        if not app.config['SCHOOLS']:
+            return jsonify({'message': 'No schools are configured'}), 400
+        if current_school.get() is not None:
+            return jsonify({'message': 'District analytics require a district administrator token'}), 403
+        return None
+    
+    @app.route('/api/schools', methods=['GET'])
+    @admin_required
+    def get_schools(current_user):
+        error = district_error()
+        if error:
+            return error
+        students = fan_out(app, lambda: db.session.execute(db.select(db.func.count(Student.id))).scalar())
+        return jsonify([{'school': school, 'students': count} for school, count in students.items()])
+    
+    @app.route('/api/schools/analytics/summary')
+    @admin_required
+    @concurrency_limited('analytics')
+    def district_summary(current_user):
+        error = district_error()
+        if error:
+            return error
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        
+        summaries = fan_out(app, lambda: school_summary(start_date, end_date))
+        totals = {field: sum(summary[field] for summary in summaries.values()) for field in next(iter(summaries.values()))}
+        return jsonify({
+            'schools': [{'school': school, **summary_rates(summary)} for school, summary in summaries.items()],
+            'total': summary_rates(totals)
+        })
+    
+    @app.route('/api/schools/analytics/attendance-trend')
+    @admin_required
+    @concurrency_limited('analytics')
+    def district_attendance_trend(current_user):
+        error = district_error()
+        if error:
+            return error
+        bucket = request.args.get('bucket', 'week')
+        group_by = [name for name in request.args.get('group_by', '').split(',') if name]
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        if bucket not in BUCKETS:
+            return jsonify({'message': f'bucket must be one of: {", ".join(BUCKETS)}'}), 400
+        if any(name not in TREND_GROUPS and name != 'school' for name in group_by):
+            return jsonify({'message': f'group_by accepts: school, {", ".join(TREND_GROUPS)}'}), 400
+        
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        # Read before fanning out; the worker threads have no request context
+        class_name = request.args.get('class_name')
+        subject = request.args.get('subject')
+        
+        def school_trend():
+            engine = attendance_trend
+            columnar = current_columnar()
+            if columnar and not reaches_archive(start_date):
+                columnar.refresh()
+                engine = columnar.attendance_trend
+            return engine(
+                bucket,
+                [name for name in group_by if name != 'school'],
+                start_date=start_date,
+                end_date=end_date,
+                class_name=class_name,
+                subject=subject
+            )
+        
+        return jsonify(merge_trends(fan_out(app, school_trend), group_by))
+    
+    app.config['STARTUP_SECONDS'] = time.perf_counter() - started
+    app.logger.info('create_app finished in %.1f ms (pid %s)', app.config['STARTUP_SECONDS'] * 1000, os.getpid())
+    
     return app
 
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+from datetime import date, datetime
+from functools import lru_cache
+from flask import current_app
+from database import db
+from models import Attendance, Grade, Term
+from tenants import school_dir
+
+# Closed terms are moved out of the hot tables into one gzipped JSON-lines file
+# per table, so everyday queries only ever scan the open terms.
+ARCHIVED_MODELS = {'attendance': Attendance, 'grade': Grade}
+
+def archive_dir():
+    return school_dir(current_app.config['ARCHIVE_DIR'])
+
+def archive_path(term, table_name):
+    return os.path.join(archive_dir(), f'term-{term.id}-{table_name}.jsonl.gz')
+
+def _encode(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def archive_term(term):
+    os.makedirs(archive_dir(), exist_ok=True)
+    counts = {}
+
+    for table_name, model in ARCHIVED_MODELS.items():
+        in_term = model.date.between(term.start_date, term.end_date)
+        path = archive_path(term, table_name)
+
+        # Write to a temporary file first so a crash never leaves a truncated archive behind
+        count = 0
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as archive:
+            rows = db.session.execute(
+                db.select(model.__table__).where(in_term).order_by(model.date.desc()),
+                execution_options={'yield_per': 1000}
+            ).mappings()
+            for row in rows:
+                archive.write(json.dumps({key: _encode(value) for key, value in row.items()}) + '\n')
+                count += 1
+        os.replace(path + '.tmp', path)
+
+        db.session.execute(db.delete(model).where(in_term), execution_options={'synchronize_session': False})
+        counts[table_name] = count
+
+    term.archived_at = datetime.utcnow()
+    db.session.commit()
+    _load_archive.cache_clear()
+    return counts
+
+@lru_cache(maxsize=16)
+def _load_archive(path):
+    rows = []
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            row = json.loads(line)
+            row['date'] = date.fromisoformat(row['date'])
+            rows.append(row)
+    return tuple(rows)
+
+def archived_rows(table_name, start_date, end_date=None, student_id=None):
+    # Rows from archived terms overlapping [start_date, end_date], newest first
+    terms = Term.query.filter(Term.archived_at.isnot(None), Term.end_date >= start_date)
+    if end_date:
+        terms = terms.filter(Term.start_date <= end_date)
+
+    result = []
+    for term in terms.order_by(Term.start_date.desc()):
+        for row in _load_archive(archive_path(term, table_name)):
+            if row['date'] < start_date or (end_date and row['date'] > end_date):
+                continue
+            if student_id is not None and row['student_id'] != student_id:
+                continue
+            result.append(row)
+    return result
+
+def reaches_archive(start_date):
+    return bool(start_date) and Term.query.filter(Term.archived_at.isnot(None), Term.end_date >= start_date).first() is not None
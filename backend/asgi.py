@@ -0,0 +1,335 @@
+import asyncio
+import csv
+import math
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import StringIO
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app import create_app
+from auth import Auth
+from models import User, Permission, Student, Attendance, Grade, Term, ChangeLog, role_permission
+
+# ASGI serving mode. The read-heavy routes below run natively on the event loop
+# with an async SQLAlchemy session (aiosqlite / asyncpg), so a slow export only
+# awaits the database instead of holding a worker. Every other route, and these
+# ones when they need the change log or archived terms, is handed to the Flask
+# app on a thread pool, so the two modes always answer the same API.
+#
+#   uvicorn --app-dir backend --factory asgi:create_asgi_app --workers 4
+#
+# Requires: pip install uvicorn aiosqlite (or asyncpg for PostgreSQL)
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+CSV_BATCH = 1000
+
+def async_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+class WsgiFallback:
+    # Hands requests to the Flask app on a pool of threads and streams the response
+    # back, closing it afterwards as WSGI requires (Flask releases concurrency slots and
+    # ends streamed sessions there). A client that disconnects stops a streamed body.
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        with SpooledTemporaryFile(max_size=65536) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+
+            disconnected = threading.Event()
+
+            async def watch():
+                while (await receive())['type'] != 'http.disconnect':
+                    pass
+                disconnected.set()
+
+            def send_from_thread(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            watcher = loop.create_task(watch())
+            try:
+                await loop.run_in_executor(self.executor, self.run, scope, body, send_from_thread, disconnected)
+            finally:
+                watcher.cancel()
+
+    def run(self, scope, body, send, disconnected):
+        start = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and start.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            start.update(message={
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            })
+
+        response = self.wsgi_application(wsgi_environ(scope, body), start_response)
+        try:
+            for chunk in response:
+                if disconnected.is_set():
+                    return
+                if not start.get('sent'):
+                    start['sent'] = True
+                    send(start['message'])
+                if chunk:
+                    send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not start.get('sent'):
+                send(start['message'])
+            send({'type': 'http.response.body'})
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+def wsgi_environ(scope, body):
+    script_name = scope.get('root_path', '')
+    path = scope['path'][len(script_name):] if scope['path'].startswith(script_name) else scope['path']
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+class Deferred(Exception):
+    # Raised by a native handler to let the Flask route answer instead
+    pass
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.fallback = WsgiFallback(flask_app, flask_app.config['ASGI_THREADS'])
+        self.engine = None
+        self.routes = {
+            '/api/students': (None, None, self.get_students),
+            '/api/export/students': ('view_data', 'exports', self.export_students),
+            '/api/export/attendance': ('view_data', 'exports', self.export_attendance),
+            '/api/export/grades': ('view_data', 'exports', self.export_grades),
+        }
+        if flask_app.config['SCHOOLS']:
+            # The async engine only knows the main database; Flask picks each request's school
+            self.routes = {}
+
+    def sessions(self):
+        # Created on first use so each worker process (and event loop) gets its own pool
+        if self.engine is None:
+            self.engine = create_async_engine(async_url(self.flask_app.config['SQLALCHEMY_DATABASE_URI']))
+            if self.engine.dialect.name == 'sqlite':
+                event.listen(self.engine.sync_engine, 'connect', _enable_sqlite_foreign_keys)
+            self._sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        return self._sessions()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        route = self.routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+        if route is None:
+            return await self.fallback(scope, receive, send)
+
+        permission, limit_scope, handler = route
+        limiter = self.flask_app.extensions.get('limiter')
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        args = {key: values[0] for key, values in parse_qs(scope['query_string'].decode()).items()}
+        try:
+            # Result processing for subject ids may need to reload the lookup cache
+            with self.flask_app.app_context():
+                async with self.sessions() as session:
+                    error = await self.authenticate(session, headers, permission)
+                    if error:
+                        return await self.respond(send, *error)
+                    # Same caps as concurrency_limited; a deferred request takes its slot again in Flask
+                    slot = await limiter_call(limiter.acquire, limit_scope) if limiter and limit_scope else 0
+                    if slot is None:
+                        return await self.respond(send, *too_many_requests(f'Too many {limit_scope} requests in progress', 1))
+                    try:
+                        await handler(session, args, send)
+                    finally:
+                        if limiter:
+                            await limiter_call(limiter.release, limit_scope, slot)
+        except Deferred:
+            await self.fallback(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Mirrors auth.token_required / permission_required, including the per-user rate limit
+
+    async def authenticate(self, session, headers, permission):
+        parts = headers.get('authorization', '').split(' ')
+        if 'authorization' in headers and len(parts) < 2:
+            return 401, {'message': 'Invalid token format'}
+        token = parts[1] if len(parts) > 1 else None
+        if not token:
+            return 401, {'message': 'Token is missing'}
+
+        user_id = Auth.decode_token(token, self.flask_app.config['SECRET_KEY'])
+        if not user_id:
+            return 401, {'message': 'Token is invalid'}
+        role_id = await session.scalar(select(User.role_id).where(User.id == user_id))
+        if role_id is None:
+            return 401, {'message': 'User not found'}
+
+        limiter = self.flask_app.extensions.get('limiter')
+        retry_after = await limiter_call(limiter.check, user_id) if limiter else 0
+        if retry_after:
+            return too_many_requests('Rate limit exceeded', retry_after)
+
+        if permission and not await session.scalar(
+            select(Permission.id)
+            .join(role_permission, role_permission.c.permission_id == Permission.id)
+            .where(role_permission.c.role_id == role_id, Permission.name == permission)
+        ):
+            return 403, {'message': 'Insufficient permissions'}
+        return None
+
+    # Responses
+
+    async def respond(self, send, status, data, headers=()):
+        body = self.flask_app.json.dumps(data).encode()
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'access-control-allow-origin', b'*'),
+            *headers
+        ]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def stream_csv(self, send, filename, watermark, header, batches):
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/csv; charset=utf-8'),
+            (b'content-disposition', f'attachment; filename={filename}'.encode()),
+            (b'x-watermark', str(watermark).encode()),
+            (b'access-control-allow-origin', b'*'),
+            (b'access-control-expose-headers', b'X-Watermark')
+        ]})
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(header)
+        async for rows in batches:
+            writer.writerows(rows)
+            await send({'type': 'http.response.body', 'body': output.getvalue().encode(), 'more_body': True})
+            output.seek(0)
+            output.truncate()
+        await send({'type': 'http.response.body', 'body': output.getvalue().encode()})
+
+    # Native routes, matching the Flask handlers of the same path
+
+    async def get_students(self, session, args, send):
+        rows = await session.execute(select(Student.id, Student.student_id, Student.name, Student.email, Student.class_name))
+        await self.respond(send, 200, [row._asdict() for row in rows])
+
+    async def export_students(self, session, args, send):
+        if args.get('since'):
+            raise Deferred()
+        watermark = await current_watermark(session)
+        result = await session.stream(select(Student.student_id, Student.name, Student.email, Student.class_name))
+        await self.stream_csv(send, 'students.csv', watermark, ['Student ID', 'Name', 'Email', 'Class'],
+                              (list(batch) async for batch in result.partitions(CSV_BATCH)))
+
+    async def export_attendance(self, session, args, send):
+        query = await dated_query(session, args, Attendance, select(
+            Attendance.date, Student.student_id, Student.name, Attendance.subject, Attendance.status
+        ))
+        watermark = await current_watermark(session)
+        result = await session.stream(query)
+        await self.stream_csv(send, 'attendance.csv', watermark, ['Date', 'Student ID', 'Student Name', 'Subject', 'Status'], (
+            [(row.date.isoformat(), row.student_id, row.name, row.subject, row.status) for row in batch]
+            async for batch in result.partitions(CSV_BATCH)
+        ))
+
+    async def export_grades(self, session, args, send):
+        query = await dated_query(session, args, Grade, select(
+            Grade.date, Student.student_id, Student.name, Grade.subject, Grade.assignment, Grade.score, Grade.max_score
+        ))
+        watermark = await current_watermark(session)
+        result = await session.stream(query)
+        await self.stream_csv(
+            send, 'grades.csv', watermark,
+            ['Date', 'Student ID', 'Student Name', 'Subject', 'Assignment', 'Score', 'Max Score', 'Percentage'], (
+                [(
+                    row.date.isoformat(), row.student_id, row.name, row.subject, row.assignment, row.score, row.max_score,
+                    round((row.score / row.max_score * 100), 2) if row.max_score > 0 else 0
+                ) for row in batch]
+                async for batch in result.partitions(CSV_BATCH)
+            )
+        )
+
+async def current_watermark(session):
+    return await session.scalar(select(func.max(ChangeLog.id))) or 0
+
+async def dated_query(session, args, model, query):
+    # Same filters and order as the Flask exports; incremental and archive-reaching requests defer to them
+    if args.get('since'):
+        raise Deferred()
+    query = query.join(Student, Student.id == model.student_id)
+    if args.get('start_date'):
+        start_date = datetime.strptime(args['start_date'], '%Y-%m-%d').date()
+        if await session.scalar(select(Term.id).where(Term.archived_at.isnot(None), Term.end_date >= start_date).limit(1)):
+            raise Deferred()
+        query = query.where(model.date >= start_date)
+    if args.get('end_date'):
+        query = query.where(model.date <= datetime.strptime(args['end_date'], '%Y-%m-%d').date())
+    return query.order_by(model.date.desc())
+
+async def limiter_call(method, *args):
+    # The shared limiter store takes SQLite write locks, which must not stall the event loop
+    return await asyncio.to_thread(method, *args)
+
+def too_many_requests(message, retry_after):
+    seconds = math.ceil(retry_after)
+    return 429, {'message': message, 'retry_after': seconds}, [
+        (b'retry-after', str(seconds).encode()),
+        (b'access-control-expose-headers', b'Retry-After')
+    ]
+
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+def create_asgi_app():
+    return AsyncApp(create_app())
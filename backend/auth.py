@@ -1,28 +1,36 @@
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 from functools import wraps
 import jwt
 import datetime
+from limits import too_many_requests
 from models import User
 
 class Auth:
     @staticmethod
-    def generate_token(user_id, secret_key):
+    def generate_token(user_id, secret_key, school=None):
         payload = {
             'exp': datetime.datetime.utcnow() + datetime.timedelta(days=1),
             'iat': datetime.datetime.utcnow(),
             'sub': user_id
         }
+        if school:
+            # User ids are only unique within one school's database
+            payload['school'] = school
         return jwt.encode(payload, secret_key, algorithm='HS256')
     
     @staticmethod
-    def decode_token(token, secret_key):
+    def decode_claims(token, secret_key):
         try:
-            payload = jwt.decode(token, secret_key, algorithms=['HS256'])
-            return payload['sub']
+            return jwt.decode(token, secret_key, algorithms=['HS256'])
         except jwt.ExpiredSignatureError:
             return None
         except jwt.InvalidTokenError:
             return None
+    
+    @staticmethod
+    def decode_token(token, secret_key):
+        payload = Auth.decode_claims(token, secret_key)
+        return payload['sub'] if payload else None
 
 def token_required(f):
     @wraps(f)
@@ -40,7 +48,6 @@ def token_required(f):
             return jsonify({'message': 'Token is missing'}), 401
         
         try:
-            from flask import current_app
             user_id = Auth.decode_token(token, current_app.config['SECRET_KEY'])
             if not user_id:
                 return jsonify({'message': 'Token is invalid'}), 401
@@ -52,6 +59,11 @@ def token_required(f):
         except Exception as e:
             return jsonify({'message': 'Token is invalid'}), 401
         
+        limiter = current_app.extensions.get('limiter')
+        retry_after = limiter.check(current_user.id) if limiter else 0
+        if retry_after:
+            return too_many_requests('Rate limit exceeded', retry_after)
+        
         return f(current_user, *args, **kwargs)
     
     return decorated
@@ -0,0 +1,144 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+from load_test import Stats
+
+parser = argparse.ArgumentParser(description='Compare the sync (gunicorn) and ASGI (uvicorn) serving modes under many concurrent clients.')
+parser.add_argument('--modes', default='sync,gthread,asgi', help='comma-separated: sync, gthread, asgi')
+parser.add_argument('--clients', type=int, default=200, help='concurrent clients')
+parser.add_argument('--duration', type=float, default=20, help='seconds per mode')
+parser.add_argument('--export-share', type=float, default=0.1, help='fraction of requests that are full attendance exports')
+parser.add_argument('--rows', type=int, default=50000, help='extra attendance rows seeded so exports are slow')
+parser.add_argument('--workers', type=int, default=4)
+parser.add_argument('--port', type=int, default=5004)
+parser.add_argument('--check-slots', action='store_true', help='only check that sequential heavy requests give back their concurrency slots')
+args = parser.parse_args()
+
+# Benchmark against a throwaway SQLite file, never the real database
+db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_file
+
+from app import create_app
+from database import db
+from lookups import subjects
+from models import Student, Attendance, User
+
+def seed(rows):
+    admin = User.query.filter_by(username='admin').first()
+    db.session.execute(db.insert(Student), [{
+        'student_id': f'B{i:06d}',
+        'name': f'Bench Student {i}',
+        'email': f'bench{i}@example.com',
+        'class_name': f'{10 + i % 3}-{"AB"[i % 2]}',
+        'created_by': admin.id
+    } for i in range(300)])
+    ids = db.session.execute(db.select(Student.id)).scalars().all()
+    start = date(2024, 1, 1)
+    # Core inserts skip the ORM flush that registers new subjects
+    subjects.current().ensure(db.session, ['Mathematics', 'Physics'])
+    db.session.execute(db.insert(Attendance), [{
+        'student_id': ids[i % len(ids)],
+        'date': start + timedelta(days=i % 365),
+        'status': ('Present', 'Absent', 'Late')[i % 3],
+        'subject': ('Mathematics', 'Physics')[i % 2],
+        'created_by': admin.id
+    } for i in range(rows)])
+    db.session.commit()
+
+COMMANDS = {
+    'sync': ['gunicorn', '--workers', '{workers}', '--worker-class', 'sync', 'app:create_app()'],
+    'gthread': ['gunicorn', '--workers', '{workers}', '--worker-class', 'gthread', '--threads', '100', 'app:create_app()'],
+    'asgi': ['uvicorn', '--factory', 'asgi:create_asgi_app', '--workers', '{workers}', '--log-level', 'warning'],
+}
+
+def launch(mode, port, env=None):
+    command = [part.format(workers=args.workers) for part in COMMANDS[mode]]
+    if command[0] == 'gunicorn':
+        command += ['--bind', f'127.0.0.1:{port}']
+    else:
+        command += ['--host', '127.0.0.1', '--port', str(port)]
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable, '-m', *command], cwd=backend_dir, env={**os.environ, 'AUTO_BOOTSTRAP': '0', 'LIMITS_ENABLED': '0', **(env or {})})
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.post(f'http://127.0.0.1:{port}/api/auth/login', json={'username': '', 'password': ''}, timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{mode} server did not start within 30 seconds')
+
+def run(mode, port):
+    base_url = f'http://127.0.0.1:{port}/api'
+    token = requests.post(f'{base_url}/auth/login', json={'username': 'admin', 'password': 'admin123'}).json()['token']
+    stats = Stats()
+    deadline = time.perf_counter() + args.duration
+
+    def client(index):
+        session = requests.Session()
+        session.headers['Authorization'] = f'Bearer {token}'
+        rng = random.Random(index)
+        while time.perf_counter() < deadline:
+            route = '/export/attendance' if rng.random() < args.export_share else '/students'
+            started = time.perf_counter()
+            try:
+                ok = session.get(f'{base_url}{route}', timeout=120).status_code == 200
+            except requests.RequestException:
+                ok = False
+            stats.record(f'GET {route}', time.perf_counter() - started, ok)
+
+    print(f'\n== {mode}: {args.clients} clients, {args.workers} workers, {args.duration:.0f}s ==')
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        list(executor.map(client, range(args.clients)))
+    stats.report(time.perf_counter() - started)
+
+def check_slots(mode, port):
+    # Every request below runs alone, so none of them may be refused for lack of a slot.
+    # Covers Flask-served JSON, Flask-streamed CSV (since=) and the native ASGI exports.
+    base_url = f'http://127.0.0.1:{port}/api'
+    session = requests.Session()
+    session.headers['Authorization'] = 'Bearer ' + session.post(f'{base_url}/auth/login', json={'username': 'admin', 'password': 'admin123'}).json()['token']
+    routes = ['/analytics/attendance-trend', '/analytics/attendance-summary', '/export/students?since=0', '/export/attendance?start_date=2024-12-01']
+    refused = [route for route in routes * 6 if session.get(f'{base_url}{route}', timeout=120).status_code == 429]
+    print(f'{mode}: {len(refused)} of {len(routes) * 6} sequential requests refused' + (f' ({", ".join(sorted(set(refused)))})' if refused else ''))
+    return not refused
+
+app = create_app()
+with app.app_context():
+    seed(args.rows)
+print(f'Seeded {args.rows} attendance rows into {db_file}')
+
+if args.check_slots:
+    passed = True
+    for mode in args.modes.split(','):
+        process = launch(mode, args.port, {
+            'LIMITS_ENABLED': '1',
+            'RATE_LIMIT_PER_MINUTE': '0',
+            'RATE_LIMIT_STORE': os.path.join(os.path.dirname(db_file), f'limits-{mode}.db')
+        })
+        try:
+            passed = check_slots(mode, args.port) and passed
+        finally:
+            process.terminate()
+            process.wait()
+    sys.exit(0 if passed else 1)
+
+for mode in args.modes.split(','):
+    process = launch(mode, args.port)
+    try:
+        run(mode, args.port)
+    finally:
+        process.terminate()
+        process.wait()
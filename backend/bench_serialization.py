@@ -0,0 +1,128 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+parser = argparse.ArgumentParser(description='Compare ORM vs row-tuple read handlers on large responses.')
+parser.add_argument('--rows', type=int, default=10000)
+parser.add_argument('--requests', type=int, default=20)
+args = parser.parse_args()
+
+# Benchmark against a throwaway SQLite file, never the real database
+db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_file
+# Measure serialization, not the per-user rate limit every request would hit
+os.environ['LIMITS_ENABLED'] = '0'
+
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+from app import create_app
+from auth import token_required
+from database import db
+from json_provider import FastJSONProvider, orjson
+from lookups import subjects
+from models import Student, Attendance, Grade, User
+
+app = create_app()
+
+# The pre-row-tuple handlers, kept here only as the "before" baseline
+@app.route('/bench/orm/students')
+@token_required
+def orm_students(current_user):
+    students = Student.query.all()
+    return jsonify([{
+        'id': s.id,
+        'student_id': s.student_id,
+        'name': s.name,
+        'email': s.email,
+        'class_name': s.class_name
+    } for s in students])
+
+@app.route('/bench/orm/attendance/<int:student_id>')
+@token_required
+def orm_attendance(current_user, student_id):
+    attendances = Attendance.query.filter_by(student_id=student_id).order_by(Attendance.date.desc()).all()
+    return jsonify([{
+        'id': a.id,
+        'date': a.date.isoformat(),
+        'status': a.status,
+        'subject': a.subject
+    } for a in attendances])
+
+@app.route('/bench/orm/grades/<int:student_id>')
+@token_required
+def orm_grades(current_user, student_id):
+    grades = Grade.query.filter_by(student_id=student_id).order_by(Grade.date.desc()).all()
+    return jsonify([{
+        'id': g.id,
+        'subject': g.subject,
+        'assignment': g.assignment,
+        'score': g.score,
+        'max_score': g.max_score,
+        'percentage': round((g.score / g.max_score * 100), 2) if g.max_score > 0 else 0,
+        'date': g.date.isoformat()
+    } for g in grades])
+
+def seed(rows):
+    admin = User.query.filter_by(username='admin').first()
+    db.session.execute(db.insert(Student), [{
+        'student_id': f'B{i:06d}',
+        'name': f'Bench Student {i}',
+        'email': f'bench{i}@example.com',
+        'class_name': f'{10 + i % 3}-{"AB"[i % 2]}',
+        'created_by': admin.id
+    } for i in range(rows)])
+    first = db.session.execute(db.select(Student.id).order_by(Student.id)).scalars().first()
+    start = date(2024, 1, 1)
+    # Core inserts skip the ORM flush that registers new subjects
+    subjects.current().ensure(db.session, ['Mathematics'])
+    db.session.execute(db.insert(Attendance), [{
+        'student_id': first,
+        'date': start + timedelta(days=i % 365),
+        'status': ('Present', 'Absent', 'Late')[i % 3],
+        'subject': 'Mathematics',
+        'created_by': admin.id
+    } for i in range(rows)])
+    db.session.execute(db.insert(Grade), [{
+        'student_id': first,
+        'subject': 'Mathematics',
+        'assignment': f'Quiz {i}',
+        'score': i % 100,
+        'max_score': 100,
+        'date': start + timedelta(days=i % 365),
+        'created_by': admin.id
+    } for i in range(rows)])
+    db.session.commit()
+    return first
+
+def measure(client, path, headers, count):
+    client.get(path, headers=headers)
+    started = time.perf_counter()
+    for _ in range(count):
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.data
+    return count / (time.perf_counter() - started)
+
+with app.app_context():
+    student = seed(args.rows)
+
+client = app.test_client()
+token = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin123'}).json['token']
+headers = {'Authorization': f'Bearer {token}'}
+
+routes = [
+    ('students', '/bench/orm/students', '/api/students'),
+    ('attendance', f'/bench/orm/attendance/{student}', f'/api/attendance/student/{student}'),
+    ('grades', f'/bench/orm/grades/{student}', f'/api/grades/student/{student}'),
+]
+
+print(f"{args.rows} rows per response, {args.requests} requests each (orjson {'available' if orjson else 'not installed'})")
+print(f"{'Endpoint':<12} {'ORM+json':>10} {'rows+json':>10} {'rows+fast':>10}  req/s")
+for name, before, after in routes:
+    app.json = DefaultJSONProvider(app)
+    orm = measure(client, before, headers, args.requests)
+    rows = measure(client, after, headers, args.requests)
+    app.json = FastJSONProvider(app)
+    fast = measure(client, after, headers, args.requests)
+    print(f"{name:<12} {orm:>10.1f} {rows:>10.1f} {fast:>10.1f}")
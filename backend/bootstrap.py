@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sys
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from database import db
+from models import User, Role, Permission, SchemaVersion
+from migrations import run_migrations
+
+# Bump when seed_initial_data changes so existing databases pick up the new seed
+SEED_VERSION = 1
+
+def schema_fingerprint():
+    parts = [f'seed:{SEED_VERSION}']
+    for table in db.metadata.sorted_tables:
+        columns = ','.join(f'{c.name}:{c.type}' for c in table.columns)
+        foreign_keys = ','.join(sorted(f'{fk.parent.name}->{fk.target_fullname}:{fk.ondelete}' for fk in table.foreign_keys))
+        indexes = ','.join(sorted(index.name for index in table.indexes))
+        parts.append(f'{table.name}({columns})[{foreign_keys}][{indexes}]')
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:16]
+
+def is_bootstrapped():
+    try:
+        return db.session.query(SchemaVersion.id).filter_by(fingerprint=schema_fingerprint()).first() is not None
+    except (OperationalError, ProgrammingError):
+        # schema_version table does not exist yet
+        db.session.rollback()
+        return False
+
+def seed_initial_data():
+    permissions_data = {
+        'admin': 'Full system access',
+        'manage_students': 'Add, edit, and delete students',
+        'manage_attendance': 'Mark and manage attendance',
+        'manage_grades': 'Add and manage grades',
+        'view_data': 'View all data',
+        'view_analytics': 'Access analytics and reports'
+    }
+
+    for perm_name, description in permissions_data.items():
+        if not Permission.query.filter_by(name=perm_name).first():
+            permission = Permission(name=perm_name, description=description)
+            db.session.add(permission)
+
+    db.session.commit()
+
+    roles_data = {
+        'admin': ['admin', 'manage_students', 'manage_attendance', 'manage_grades', 'view_data', 'view_analytics'],
+        'teacher': ['manage_students', 'manage_attendance', 'manage_grades', 'view_data', 'view_analytics'],
+        'viewer': ['view_data', 'view_analytics']
+    }
+
+    for role_name, perm_names in roles_data.items():
+        role = Role.query.filter_by(name=role_name).first()
+        if not role:
+            role = Role(name=role_name, description=f'{role_name.title()} role')
+            db.session.add(role)
+            db.session.flush()
+
+        for perm_name in perm_names:
+            permission = Permission.query.filter_by(name=perm_name).first()
+            if permission and permission not in role.permissions:
+                role.permissions.append(permission)
+
+    db.session.commit()
+
+    if not User.query.filter_by(username='admin').first():
+        admin_role = Role.query.filter_by(name='admin').first()
+        admin_user = User(
+            username='admin',
+            email='admin@school.edu',
+            role_id=admin_role.id
+        )
+        admin_user.set_password('admin123')
+        db.session.add(admin_user)
+
+    if not User.query.filter_by(username='teacher').first():
+        teacher_role = Role.query.filter_by(name='teacher').first()
+        teacher_user = User(
+            username='teacher',
+            email='teacher@school.edu',
+            role_id=teacher_role.id
+        )
+        teacher_user.set_password('teacher123')
+        db.session.add(teacher_user)
+
+    if not User.query.filter_by(username='viewer').first():
+        viewer_role = Role.query.filter_by(name='viewer').first()
+        viewer_user = User(
+            username='viewer',
+            email='viewer@school.edu',
+            role_id=viewer_role.id
+        )
+        viewer_user.set_password('viewer123')
+        db.session.add(viewer_user)
+
+    db.session.commit()
+
+def bootstrap():
+    fresh = not db.inspect(db.engine).has_table('student')
+    # Not db.create_all(): that always targets the default database, not the current school's
+    db.metadata.create_all(db.engine)
+    run_migrations(fresh)
+    try:
+        seed_initial_data()
+        db.session.add(SchemaVersion(fingerprint=schema_fingerprint(), applied_at=datetime.utcnow()))
+        db.session.commit()
+    except (IntegrityError, OperationalError):
+        # Another worker bootstrapped concurrently
+        db.session.rollback()
+        if not is_bootstrapped():
+            raise
+
+if __name__ == '__main__':
+    # Run once per deploy: python backend/bootstrap.py [--force]
+    # Covers the main database and every school in SCHOOLS.
+    os.environ['AUTO_BOOTSTRAP'] = '0'
+    from app import create_app
+    from tenants import school_context
+
+    app = create_app()
+    for school in [None] + app.config['SCHOOLS']:
+        label = f"school {school}" if school else "main database"
+        with school_context(app, school):
+            if '--force' not in sys.argv and is_bootstrapped():
+                print(f"Schema {schema_fingerprint()} already bootstrapped ({label})")
+            else:
+                bootstrap()
+                print(f"Bootstrapped schema {schema_fingerprint()} ({label})")
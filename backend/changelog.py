@@ -0,0 +1,101 @@
+import json
+from datetime import date, datetime
+from sqlalchemy import event, func, literal_column
+from sqlalchemy.orm import Session
+from database import db
+from lookups import decoded
+from models import Student, Attendance, Grade, ChangeLog
+
+# Append-only record of every student, attendance and grade write. The change_log
+# id doubles as the sync watermark handed to export clients.
+TRACKED = {Student: 'student', Attendance: 'attendance', Grade: 'grade'}
+
+def _pending(session):
+    # Entries collected by this transaction's flushes, written just before it commits
+    return session.info.setdefault('change_log', [])
+
+def snapshot(obj):
+    values = {}
+    for column in obj.__table__.columns:
+        value = getattr(obj, column.key)
+        values[column.name] = value.isoformat() if isinstance(value, (date, datetime)) else value
+    return values
+
+@event.listens_for(Session, 'after_flush')
+def record_changes(session, flush_context):
+    entries = []
+    for operation, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            entity = TRACKED.get(type(obj))
+            if not entity:
+                continue
+            if operation == 'update' and not session.is_modified(obj, include_collections=False):
+                continue
+            entries.append({'entity': entity, 'entity_id': obj.id, 'operation': operation, 'snapshot': snapshot(obj)})
+    _pending(session).extend(entries)
+
+@event.listens_for(Session, 'before_commit')
+def write_log(session):
+    # max(id) is only a safe watermark if ids become visible in order. PostgreSQL hands
+    # out sequence values at insert time, so a transaction could otherwise commit id N
+    # after a reader has already moved past N. Writing the log last, under a lock held
+    # only from that insert to the commit, makes writers take turns for just that step.
+    # The lock is keyed on the table, so each school schema has its own.
+    # SQLite already serializes writers.
+    session.flush()
+    entries = session.info.pop('change_log', None)
+    if entries:
+        connection = session.connection()
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql("SELECT pg_advisory_xact_lock('change_log'::regclass::oid::bigint)")
+        connection.execute(db.insert(ChangeLog), entries)
+
+@event.listens_for(Session, 'after_rollback')
+def drop_log(session):
+    session.info.pop('change_log', None)
+
+def _json_row(connection, table):
+    build = func.json_build_object if connection.dialect.name == 'postgresql' else func.json_object
+    return build(*[arg for column in table.columns for arg in (literal_column(f"'{column.name}'"), decoded(column))])
+
+def log_student_deletes(student_filter):
+    # Bulk and cascaded deletes bypass the ORM, so snapshot the rows before they happen
+    connection = db.session.connection()
+    student_ids = db.select(Student.id).where(student_filter)
+    entries = _pending(db.session)
+    for model, entity in TRACKED.items():
+        table = model.__table__
+        match = table.c.id.in_(student_ids) if model is Student else table.c.student_id.in_(student_ids)
+        for id, row in connection.execute(db.select(table.c.id, _json_row(connection, table)).where(match)):
+            # SQLite's json_object comes back as text
+            values = json.loads(row) if isinstance(row, str) else row
+            entries.append({'entity': entity, 'entity_id': id, 'operation': 'delete', 'snapshot': values})
+
+def current_watermark():
+    return db.session.execute(db.select(func.max(ChangeLog.id))).scalar() or 0
+
+def changes_since(entity, since, watermark):
+    # Latest change per row in (since, watermark]; earlier edits to the same row are superseded
+    latest = (
+        db.select(func.max(ChangeLog.id))
+        .where(ChangeLog.entity == entity, ChangeLog.id > since, ChangeLog.id <= watermark)
+        .group_by(ChangeLog.entity_id)
+    )
+    return db.session.execute(
+        db.select(ChangeLog.operation, ChangeLog.snapshot).where(ChangeLog.id.in_(latest)).order_by(ChangeLog.id)
+    ).all()
+
+def student_lookup(student_ids):
+    # Maps database ids to (student_id, name), falling back to the snapshot of deleted students
+    students = {row.id: (row.student_id, row.name) for row in db.session.execute(
+        db.select(Student.id, Student.student_id, Student.name).where(Student.id.in_(student_ids))
+    )}
+    missing = set(student_ids) - set(students)
+    if missing:
+        for row in db.session.execute(
+            db.select(ChangeLog.entity_id, ChangeLog.snapshot)
+            .where(ChangeLog.entity == 'student', ChangeLog.entity_id.in_(missing))
+            .order_by(ChangeLog.id)
+        ):
+            students[row.entity_id] = (row.snapshot['student_id'], row.snapshot['name'])
+    return students
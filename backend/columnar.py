@@ -0,0 +1,274 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+from datetime import date
+from sqlalchemy import type_coerce
+from database import db
+from lookups import STATUS_CODES
+from models import Student, Attendance, Grade, ChangeLog
+from tenants import school_dir
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Optional analytics engine: attendance and grades as compact NumPy columns.
+# The base snapshot is written once to .npy files and memory-mapped read-only,
+# so every gunicorn worker shares the same pages. Each worker tails the change
+# log and keeps the (small) set of rows written since the snapshot in memory;
+# once that delta grows past COLUMNAR_MAX_DELTA one worker writes a new snapshot.
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+if np is not None:
+    ATTENDANCE_DTYPE = np.dtype([('id', 'i8'), ('student', 'i4'), ('subject', 'i2'), ('status', 'i1'), ('day', 'i4')])
+    GRADE_DTYPE = np.dtype([('id', 'i8'), ('student', 'i4'), ('subject', 'i2'), ('score', 'f4'), ('max_score', 'f4'), ('day', 'i4')])
+
+class Table:
+    def __init__(self, base, dtype):
+        self.base = base
+        self.dtype = dtype
+        self.delta = {}
+        self._merged = None
+
+    def apply(self, row_id, values):
+        # values is None for deletes
+        self.delta[row_id] = values
+        self._merged = None
+
+    def rows(self):
+        if self._merged is None:
+            live = [values for values in self.delta.values() if values is not None]
+            added = np.array(live, dtype=self.dtype)
+            if self.delta:
+                keep = ~np.isin(self.base['id'], np.fromiter(self.delta, dtype='i8', count=len(self.delta)))
+                self._merged = np.concatenate([self.base[keep], added])
+            else:
+                self._merged = self.base
+        return self._merged
+
+class ColumnarStore:
+    def __init__(self, app):
+        self.app = app
+        self.directory = school_dir(app.config['COLUMNAR_DIR'])
+        self.max_delta = app.config['COLUMNAR_MAX_DELTA']
+        self.lock = threading.Lock()
+        self.generation = None
+
+    # Snapshot files
+
+    def _pointer(self):
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def rebuild(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'build.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            previous = self._pointer()
+            if previous and previous != self.generation:
+                # Another worker rebuilt while we waited for the lock
+                return
+
+            # Rows committed after this watermark arrive through the change log as delta
+            watermark = db.session.execute(db.select(db.func.max(ChangeLog.id))).scalar() or 0
+            subjects = {}
+
+            def code(subject):
+                return subjects.setdefault(subject, len(subjects))
+
+            attendance = np.array([
+                (row.id, row.student_id, code(row.subject), row.status, row.date.toordinal())
+                for row in db.session.execute(
+                    # Stored status codes are used as they are
+                    db.select(
+                        Attendance.id, Attendance.student_id, Attendance.subject,
+                        type_coerce(Attendance.status, db.SmallInteger).label('status'), Attendance.date
+                    ),
+                    execution_options={'yield_per': 10000}
+                )
+            ], dtype=ATTENDANCE_DTYPE)
+            grades = np.array([
+                (row.id, row.student_id, code(row.subject), row.score, row.max_score, row.date.toordinal())
+                for row in db.session.execute(
+                    db.select(Grade.id, Grade.student_id, Grade.subject, Grade.score, Grade.max_score, Grade.date),
+                    execution_options={'yield_per': 10000}
+                )
+            ], dtype=GRADE_DTYPE)
+
+            # Never reuse a generation number: other workers may still have its files mapped
+            generations = [int(name[4:]) for name in os.listdir(self.directory) if name.startswith('gen-')]
+            generation = str(max(generations, default=0) + 1)
+            path = os.path.join(self.directory, f'gen-{generation}')
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, 'attendance.npy'), attendance)
+            np.save(os.path.join(path, 'grade.npy'), grades)
+            with open(os.path.join(path, 'meta.json'), 'w') as f:
+                json.dump({'watermark': watermark, 'subjects': list(subjects)}, f)
+
+            with open(os.path.join(self.directory, 'CURRENT.tmp'), 'w') as f:
+                f.write(generation)
+            os.replace(os.path.join(self.directory, 'CURRENT.tmp'), os.path.join(self.directory, 'CURRENT'))
+
+            # Workers still mapping older generations keep their pages until they remap
+            for name in os.listdir(self.directory):
+                if name.startswith('gen-') and name not in (f'gen-{generation}', f'gen-{previous}'):
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def invalidate(self):
+        # Bulk changes that bypass the change log (term archival) force a fresh snapshot
+        try:
+            os.remove(os.path.join(self.directory, 'CURRENT'))
+        except FileNotFoundError:
+            pass
+
+    def _load(self, generation):
+        path = os.path.join(self.directory, f'gen-{generation}')
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.generation = generation
+        self.watermark = meta['watermark']
+        self.subjects = meta['subjects']
+        self.subject_codes = {subject: index for index, subject in enumerate(self.subjects)}
+        self.attendance = Table(np.load(os.path.join(path, 'attendance.npy'), mmap_mode='r'), ATTENDANCE_DTYPE)
+        self.grades = Table(np.load(os.path.join(path, 'grade.npy'), mmap_mode='r'), GRADE_DTYPE)
+        self._load_students()
+
+    def _load_students(self):
+        rows = db.session.execute(db.select(Student.id, Student.class_name)).all()
+        self.class_names = sorted({class_name for _, class_name in rows})
+        codes = {class_name: index for index, class_name in enumerate(self.class_names)}
+        self.student_class = np.full(max((student_id for student_id, _ in rows), default=0) + 1, -1, dtype='i4')
+        for student_id, class_name in rows:
+            self.student_class[student_id] = codes[class_name]
+
+    # Keeping up with writes
+
+    def subject_code(self, subject):
+        if subject not in self.subject_codes:
+            self.subject_codes[subject] = len(self.subjects)
+            self.subjects.append(subject)
+        return self.subject_codes[subject]
+
+    def refresh(self):
+        with self.lock:
+            generation = self._pointer()
+            if generation is None:
+                self.rebuild()
+                generation = self._pointer()
+            if generation != self.generation:
+                self._load(generation)
+            self._apply_changes()
+
+            if len(self.attendance.delta) + len(self.grades.delta) > self.max_delta:
+                self.rebuild()
+                self._load(self._pointer())
+                self._apply_changes()
+
+    def _apply_changes(self):
+        changes = db.session.execute(
+            db.select(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.operation, ChangeLog.snapshot)
+            .where(ChangeLog.id > self.watermark)
+            .order_by(ChangeLog.id)
+        ).all()
+        students_changed = False
+        for change in changes:
+            row = change.snapshot
+            deleted = change.operation == 'delete'
+            if change.entity == 'attendance':
+                self.attendance.apply(change.entity_id, None if deleted else (
+                    row['id'], row['student_id'], self.subject_code(row['subject']),
+                    STATUS_CODES[row['status']], date.fromisoformat(row['date']).toordinal()
+                ))
+            elif change.entity == 'grade':
+                self.grades.apply(change.entity_id, None if deleted else (
+                    row['id'], row['student_id'], self.subject_code(row['subject']),
+                    row['score'], row['max_score'], date.fromisoformat(row['date']).toordinal()
+                ))
+            else:
+                students_changed = True
+        if changes:
+            self.watermark = changes[-1].id
+        if students_changed:
+            self._load_students()
+
+    # Vectorized queries
+
+    def _filter_mask(self, rows, start_date, end_date, subject):
+        mask = np.ones(len(rows), dtype=bool)
+        if start_date:
+            mask &= rows['day'] >= start_date.toordinal()
+        if end_date:
+            mask &= rows['day'] <= end_date.toordinal()
+        if subject:
+            mask &= rows['subject'] == self.subject_codes.get(subject, -1)
+        return mask
+
+    def attendance_counts(self, start_date=None, end_date=None, subject=None, size=0):
+        # (total, present) per student id, as arrays indexed by student id
+        rows = self.attendance.rows()
+        rows = rows[self._filter_mask(rows, start_date, end_date, subject)]
+        size = max(size, int(rows['student'].max(initial=0)) + 1)
+        total = np.bincount(rows['student'], minlength=size)
+        present = np.bincount(rows['student'][rows['status'] == STATUS_CODES['Present']], minlength=size)
+        return total, present
+
+    def grade_averages(self, start_date=None, end_date=None, subject=None, size=0):
+        # (count, summed percentage) per student id
+        rows = self.grades.rows()
+        rows = rows[self._filter_mask(rows, start_date, end_date, subject)]
+        size = max(size, int(rows['student'].max(initial=0)) + 1)
+        max_score = rows['max_score'].astype('f8')
+        percentage = np.divide(rows['score'] * 100.0, max_score, out=np.zeros(len(rows)), where=max_score > 0)
+        return np.bincount(rows['student'], minlength=size), np.bincount(rows['student'], weights=percentage, minlength=size)
+
+    def attendance_trend(self, bucket, group_by, start_date=None, end_date=None, class_name=None, subject=None):
+        rows = self.attendance.rows()
+        rows = rows[self._filter_mask(rows, start_date, end_date, subject)]
+        student = rows['student']
+        classes = np.where(student < len(self.student_class), self.student_class[np.minimum(student, len(self.student_class) - 1)], -1)
+        keep = classes >= 0
+        if class_name:
+            keep &= classes == (self.class_names.index(class_name) if class_name in self.class_names else -2)
+        rows, classes = rows[keep], classes[keep]
+
+        days = rows['day'].astype('i8')
+        if bucket == 'week':
+            days = days - (days - 1) % 7
+        elif bucket == 'month':
+            months = (days - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]')
+            days = months.astype('datetime64[D]').astype('i8') + EPOCH_ORDINAL
+
+        columns = {'class_name': classes.astype('i8'), 'subject': rows['subject'].astype('i8')}
+        labels = {'class_name': self.class_names, 'subject': self.subjects}
+
+        # Pack (period, group codes...) into one int64 so grouping is a 1-D unique + bincount
+        keys = days
+        for name in group_by:
+            keys = keys * len(labels[name]) + columns[name]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = {
+            'total': np.bincount(inverse, minlength=len(unique)),
+            'present': np.bincount(inverse[rows['status'] == STATUS_CODES['Present']], minlength=len(unique)),
+            'late': np.bincount(inverse[rows['status'] == STATUS_CODES['Late']], minlength=len(unique)),
+            'absent': np.bincount(inverse[rows['status'] == STATUS_CODES['Absent']], minlength=len(unique))
+        }
+
+        result = []
+        for index, key in enumerate(unique.tolist()):
+            entry = {}
+            for name in reversed(group_by):
+                key, code = divmod(key, len(labels[name]))
+                entry[name] = labels[name][code]
+            entry['period'] = date.fromordinal(key).isoformat()
+            for field in counts:
+                entry[field] = int(counts[field][index])
+            entry['attendance_rate'] = round(entry['present'] / entry['total'] * 100, 2) if entry['total'] else 0
+            result.append(entry)
+        return sorted(result, key=lambda entry: tuple(entry[name] for name in ['period'] + group_by))
@@ -6,5 +6,51 @@ class Config:
     basedir = os.path.abspath(os.path.dirname(__file__))
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'instance', 'attendance.db'))
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Comma-separated school ids; each school gets its own database from SCHOOL_DATABASE_URL
+    # ({school} is replaced; for PostgreSQL schemas use ...?options=-csearch_path%3D{school}).
+    # DATABASE_URL then only holds the district administrators.
+    SCHOOLS = [s.strip() for s in os.environ.get('SCHOOLS', '').split(',') if s.strip()]
+    SCHOOL_DATABASE_URL = os.environ.get('SCHOOL_DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'instance', 'schools', '{school}.db'))
+    # Connections kept open per school and worker process (PostgreSQL), and threads used to
+    # query every school at once for the district analytics
+    SHARD_POOL_SIZE = int(os.environ.get('SHARD_POOL_SIZE', '2'))
+    SHARD_FANOUT_THREADS = int(os.environ.get('SHARD_FANOUT_THREADS', '8'))
+    # Compressed attendance/grade files for archived terms
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(basedir, 'instance', 'archive'))
+    # Per-class report card runs; REPORT_WORKERS processes each (defaults to the CPU count)
+    REPORTS_DIR = os.environ.get('REPORTS_DIR', os.path.join(basedir, 'instance', 'reports'))
+    REPORT_WORKERS = int(os.environ['REPORT_WORKERS']) if os.environ.get('REPORT_WORKERS') else None
     JWT_SECRET_KEY = os.environ.get('SESSION_SECRET', 'dev-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=1)
+    # Create tables and seed roles/users on startup when the schema fingerprint is missing.
+    # Set to 0 in production and run `python backend/bootstrap.py` once per deploy instead.
+    AUTO_BOOTSTRAP = os.environ.get('AUTO_BOOTSTRAP', '1') == '1'
+    # Serialize responses with orjson when it is installed
+    FAST_JSON = os.environ.get('FAST_JSON', '1') == '1'
+    # How often each worker checks the change log for /api/stream/attendance subscribers
+    STREAM_POLL_SECONDS = float(os.environ.get('STREAM_POLL_SECONDS', '1.0'))
+    # Threads for the routes asgi.py hands to Flask when serving in ASGI mode
+    ASGI_THREADS = int(os.environ.get('WORKER_THREADS', '100'))
+    # Open /api/stream/attendance connections per worker process. Under gthread (and in
+    # ASGI mode) each one holds a request thread, so keep this well below WORKER_THREADS;
+    # gevent workers can hold thousands.
+    STREAM_SUBSCRIBERS = int(os.environ.get('STREAM_SUBSCRIBERS') or (
+        5000 if os.environ.get('WORKER_CLASS') == 'gevent' else max(1, int(os.environ.get('WORKER_THREADS', '100')) // 4)
+    ))
+    # Per-user token bucket checked by token_required: sustained requests per minute and
+    # burst size (0 disables). Heavy route groups also cap concurrent requests (0 = no cap).
+    LIMITS_ENABLED = os.environ.get('LIMITS_ENABLED', '1') == '1'
+    RATE_LIMIT_PER_MINUTE = int(os.environ.get('RATE_LIMIT_PER_MINUTE', '300'))
+    RATE_LIMIT_BURST = int(os.environ.get('RATE_LIMIT_BURST', '60'))
+    CONCURRENCY_LIMITS = {
+        'analytics': int(os.environ.get('ANALYTICS_CONCURRENCY', '4')),
+        'exports': int(os.environ.get('EXPORT_CONCURRENCY', '2')),
+        'bulk_writes': int(os.environ.get('BULK_WRITE_CONCURRENCY', '8'))
+    }
+    CONCURRENCY_SLOT_TIMEOUT = int(os.environ.get('CONCURRENCY_SLOT_TIMEOUT', '300'))
+    # 'memory' keeps limiter state per worker; a file path shares it between all workers on the host
+    RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', os.path.join(basedir, 'instance', 'limits.db'))
+    # 'columnar' answers analytics from memory-mapped NumPy arrays (requires numpy)
+    ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'sql')
+    COLUMNAR_DIR = os.environ.get('COLUMNAR_DIR', os.path.join(basedir, 'instance', 'columnar'))
+    COLUMNAR_MAX_DELTA = int(os.environ.get('COLUMNAR_MAX_DELTA', '20000'))
@@ -1,3 +1,47 @@
+import sqlite3
+import threading
+from contextvars import ContextVar
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
-db = SQLAlchemy()
+# The school whose database the current request (or worker thread) uses; None is the
+# default database. Each school in SCHOOLS is a Flask-SQLAlchemy bind with its own pool.
+current_school = ContextVar('current_school', default=None)
+
+class SchoolSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        school = current_school.get()
+        if bind is None and school is not None:
+            return self._db.engines[school]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+class SchoolSQLAlchemy(SQLAlchemy):
+    @property
+    def engine(self):
+        return self.engines[current_school.get()]
+
+db = SchoolSQLAlchemy(session_options={'class_': SchoolSession})
+
+class PerSchool:
+    # One instance of a per-process cache for each school, created on first use
+    def __init__(self, factory):
+        self.factory = factory
+        self.instances = {}
+        self.lock = threading.Lock()
+
+    def current(self):
+        school = current_school.get()
+        with self.lock:
+            if school not in self.instances:
+                self.instances[school] = self.factory(school)
+            return self.instances[school]
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys (and so ON DELETE CASCADE) unless enabled per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
@@ -0,0 +1,194 @@
+import re
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from archive import archived_rows
+from changelog import current_watermark
+from database import db
+from models import Student, Grade, GradeTotal, GradeWeight, ChangeLog, SyncCursor, Term
+
+# Weighted term grades. Each grade belongs to a category taken from its assignment
+# name, and grade_total keeps a running count and percentage sum per (student, term,
+# subject, category). Category weights are applied when reading, so changing them
+# never rewrites the totals. Like absence_streak, the totals are brought up to date
+# from the change log and only students whose grades changed are re-read.
+CURSOR = 'grade_totals'
+
+# First match wins; anything else is 'other'
+CATEGORIES = (
+    ('exam', re.compile(r'\b(exam|midterm|final|test)\b', re.IGNORECASE)),
+    ('quiz', re.compile(r'\bquiz', re.IGNORECASE)),
+    ('project', re.compile(r'\bproject', re.IGNORECASE)),
+    ('homework', re.compile(r'\b(homework|hw|assignment)\b', re.IGNORECASE)),
+)
+CATEGORY_NAMES = tuple(name for name, _ in CATEGORIES) + ('other',)
+# Used until an administrator stores default weights
+DEFAULT_WEIGHTS = {'exam': 50, 'quiz': 20, 'project': 20, 'homework': 10, 'other': 10}
+# (minimum percentage, grade points); the last row catches everything below, including
+# negative scores, which the grade routes accept
+GPA_SCALE = ((93, 4.0), (90, 3.7), (87, 3.3), (83, 3.0), (80, 2.7), (77, 2.3), (73, 2.0), (70, 1.7), (67, 1.3), (65, 1.0), (float('-inf'), 0.0))
+
+def category(assignment):
+    for name, pattern in CATEGORIES:
+        if pattern.search(assignment):
+            return name
+    return 'other'
+
+def grade_points(percentage):
+    return next(points for minimum, points in GPA_SCALE if percentage >= minimum)
+
+def _term_of(terms):
+    # SQL expression giving the id of the term containing Grade.date
+    if not terms:
+        return db.null()
+    return case(*[(Grade.date.between(t.start_date, t.end_date), t.id) for t in terms], else_=None)
+
+def _live_totals(terms, student_ids=None):
+    # Grouped by assignment in the database; assignments map to categories here
+    term_id = _term_of(terms).label('term_id')
+    percentage = case((Grade.max_score > 0, Grade.score / Grade.max_score * 100))
+    query = (
+        db.select(Grade.student_id, term_id, Grade.subject, Grade.assignment, func.count(percentage), func.sum(percentage))
+        .group_by(Grade.student_id, term_id, Grade.subject, Grade.assignment)
+    )
+    if student_ids is not None:
+        query = query.where(Grade.student_id.in_(student_ids))
+
+    totals = defaultdict(lambda: [0, 0.0])
+    for student_id, term, subject, assignment, count, percentage_sum in db.session.execute(query):
+        if count:
+            key = (student_id, term, subject, category(assignment))
+            totals[key][0] += count
+            totals[key][1] += percentage_sum
+    return totals
+
+def _archived_totals(terms):
+    # Archives keep the grades of students deleted since
+    students = set(db.session.execute(db.select(Student.id)).scalars()) if terms else set()
+    totals = defaultdict(lambda: [0, 0.0])
+    for term in terms:
+        for row in archived_rows('grade', term.start_date, term.end_date):
+            if row['max_score'] > 0 and row['student_id'] in students:
+                key = (row['student_id'], term.id, row['subject'], category(row['assignment']))
+                totals[key][0] += 1
+                totals[key][1] += row['score'] / row['max_score'] * 100
+    return totals
+
+def _store(totals, skip_terms=()):
+    rows = [
+        {'student_id': student_id, 'term_id': term_id, 'subject': subject, 'category': name, 'count': count, 'percentage_sum': percentage_sum}
+        for (student_id, term_id, subject, name), (count, percentage_sum) in totals.items()
+        if term_id not in skip_terms
+    ]
+    if rows:
+        db.session.execute(db.insert(GradeTotal), rows)
+
+def refresh_totals():
+    watermark = current_watermark()
+    # Locked so two workers never fold the same changes twice (PostgreSQL; SQLite serializes writers)
+    cursor = db.session.get(SyncCursor, CURSOR, with_for_update=True)
+    terms = Term.query.all()
+    archived = [t for t in terms if t.archived_at]
+
+    if cursor is None:
+        db.session.execute(db.delete(GradeTotal))
+        _store(_live_totals(terms), skip_terms={t.id for t in archived})
+        _store(_archived_totals(archived))
+        db.session.add(SyncCursor(name=CURSOR, position=watermark))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another worker built them at the same time; carry on from its cursor
+            db.session.rollback()
+            return refresh_totals()
+        return
+
+    if watermark <= cursor.position:
+        db.session.commit()
+        return
+
+    student_ids = {row['student_id'] for (row,) in db.session.execute(
+        db.select(ChangeLog.snapshot)
+        .where(ChangeLog.entity == 'grade', ChangeLog.id > cursor.position, ChangeLog.id <= watermark)
+    )}
+    if student_ids:
+        # Archived terms' grades are no longer in the grade table; their totals stay as they were
+        archived_ids = [t.id for t in archived]
+        open_terms = db.or_(GradeTotal.term_id.is_(None), GradeTotal.term_id.notin_(archived_ids))
+        db.session.execute(db.delete(GradeTotal).where(GradeTotal.student_id.in_(student_ids), open_terms))
+        _store(_live_totals(terms, student_ids), skip_terms=set(archived_ids))
+
+    cursor.position = watermark
+    db.session.commit()
+
+def reset_totals():
+    # Rebuilt on the next read, e.g. after a new term changes which term old grades fall in
+    db.session.execute(db.delete(SyncCursor).where(SyncCursor.name == CURSOR))
+
+def weights():
+    # {subject or None: {category: weight}}; None is the default for every other subject
+    stored = defaultdict(dict)
+    for subject, name, weight in db.session.execute(db.select(GradeWeight.subject, GradeWeight.category, GradeWeight.weight)):
+        stored[subject][name] = weight
+    result = {None: stored.pop(None, None) or dict(DEFAULT_WEIGHTS)}
+    result.update(stored)
+    return result
+
+def set_weights(subject, new_weights):
+    # Replaces one subject's weights (or the default's); an empty dict clears a subject's own weights
+    unknown = set(new_weights) - set(CATEGORY_NAMES)
+    if unknown:
+        raise ValueError(f'Unknown categories: {", ".join(sorted(unknown))}; use {", ".join(CATEGORY_NAMES)}')
+    if any(not isinstance(w, (int, float)) or w < 0 for w in new_weights.values()):
+        raise ValueError('Weights must be non-negative numbers')
+
+    match = GradeWeight.subject == subject if subject else GradeWeight.subject.is_(None)
+    db.session.execute(db.delete(GradeWeight).where(match))
+    for name, weight in new_weights.items():
+        db.session.add(GradeWeight(subject=subject, category=name, weight=weight))
+    db.session.commit()
+
+def weighted_grade(categories, subject_weights):
+    # Categories without grades drop out and the remaining weights are scaled up to 100%
+    used = {name: subject_weights.get(name, 0) for name in categories if subject_weights.get(name, 0) > 0}
+    if not used:
+        return None
+    return sum(weight * categories[name][1] / categories[name][0] for name, weight in used.items()) / sum(used.values())
+
+def current_term():
+    # The term containing today, else the most recent one to have started
+    return Term.query.filter(Term.start_date <= date.today()).order_by(Term.start_date.desc()).first()
+
+def term_grades(student_ids, term_id):
+    # {student id: {'subjects': [...], 'gpa': ...}} read from grade_total
+    refresh_totals()
+    all_weights = weights()
+    match = GradeTotal.term_id == term_id if term_id else GradeTotal.term_id.is_(None)
+
+    totals = defaultdict(lambda: defaultdict(dict))
+    for row in db.session.execute(
+        db.select(GradeTotal.student_id, GradeTotal.subject, GradeTotal.category, GradeTotal.count, GradeTotal.percentage_sum)
+        .where(GradeTotal.student_id.in_(student_ids), match)
+    ):
+        totals[row.student_id][row.subject][row.category] = (row.count, row.percentage_sum)
+
+    result = {}
+    for student_id in student_ids:
+        subjects = []
+        for subject, categories in sorted(totals[student_id].items()):
+            subject_weights = all_weights.get(subject, all_weights[None])
+            grade = weighted_grade(categories, subject_weights)
+            subjects.append({
+                'subject': subject,
+                'grade': round(grade, 2) if grade is not None else None,
+                'points': grade_points(grade) if grade is not None else None,
+                'categories': {name: {
+                    'assignments': count,
+                    'average': round(percentage_sum / count, 2),
+                    'weight': subject_weights.get(name, 0)
+                } for name, (count, percentage_sum) in sorted(categories.items())}
+            })
+        points = [s['points'] for s in subjects if s['points'] is not None]
+        result[student_id] = {'subjects': subjects, 'gpa': round(sum(points) / len(points), 2) if points else None}
+    return result
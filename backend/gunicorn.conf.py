@@ -0,0 +1,20 @@
+import os
+import time
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = f"0.0.0.0:{os.environ.get('PORT', '5002')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+# /api/stream/attendance holds its connection open; use gthread (or gevent) so idle
+# subscribers occupy a thread rather than a whole sync worker. Under gthread at most
+# STREAM_SUBSCRIBERS (a quarter of the threads by default) are streams, so ordinary
+# requests always have threads left; WORKER_CLASS=gevent serves thousands per worker.
+worker_class = os.environ.get('WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('WORKER_THREADS', '100'))
+# Build the app (and bootstrap the schema) once in the master, then fork workers from it
+preload_app = True
+
+def pre_fork(server, worker):
+    worker.spawned_at = time.perf_counter()
+
+def post_worker_init(worker):
+    worker.log.info('Worker %s ready in %.1f ms', worker.pid, (time.perf_counter() - worker.spawned_at) * 1000)
@@ -0,0 +1,180 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import current_app, jsonify, make_response
+from database import current_school
+
+# Per-user token buckets (checked in auth.token_required) and caps on how many
+# expensive requests may run at once. Both refuse immediately with 429 and a
+# Retry-After header instead of queueing work behind a saturated worker.
+
+class MemoryStore:
+    # Limits apply per worker process
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.slots = {}
+        self.next_slot = 0
+
+    def take(self, key, rate, burst, now):
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self.buckets[key] = (tokens - 1, now)
+            return 0
+
+    def acquire(self, scope, cap, now, timeout):
+        with self.lock:
+            held = self.slots.setdefault(scope, set())
+            if len(held) >= cap:
+                return None
+            self.next_slot += 1
+            held.add(self.next_slot)
+            return self.next_slot
+
+    def release(self, scope, slot):
+        with self.lock:
+            self.slots.get(scope, set()).discard(slot)
+
+class SQLiteStore:
+    # Shared by every worker on the host through one small SQLite file. Losing
+    # it on a crash only resets the limits, so writes skip fsync.
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    def _connection(self):
+        if getattr(self.local, 'pid', None) != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS slot (id INTEGER PRIMARY KEY, scope TEXT NOT NULL, acquired REAL NOT NULL)')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def _transaction(self, work):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(connection)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return result
+
+    def take(self, key, rate, burst, now):
+        def work(connection):
+            row = connection.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = min(burst, row[0] + (now - row[1]) * rate) if row else burst
+            retry_after = (1 - tokens) / rate if tokens < 1 else 0
+            connection.execute(
+                'INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, tokens if retry_after else tokens - 1, now)
+            )
+            return retry_after
+        return self._transaction(work)
+
+    def acquire(self, scope, cap, now, timeout):
+        def work(connection):
+            # Slots still held after timeout belonged to a killed worker
+            connection.execute('DELETE FROM slot WHERE scope = ? AND acquired < ?', (scope, now - timeout))
+            held = connection.execute('SELECT COUNT(*) FROM slot WHERE scope = ?', (scope,)).fetchone()[0]
+            if held >= cap:
+                return None
+            return connection.execute('INSERT INTO slot (scope, acquired) VALUES (?, ?)', (scope, now)).lastrowid
+        return self._transaction(work)
+
+    def release(self, scope, slot):
+        self._connection().execute('DELETE FROM slot WHERE id = ?', (slot,))
+
+class Limiter:
+    def __init__(self, app):
+        store = app.config['RATE_LIMIT_STORE']
+        self.store = MemoryStore() if store == 'memory' else SQLiteStore(store)
+        self.rate = app.config['RATE_LIMIT_PER_MINUTE'] / 60
+        self.burst = app.config['RATE_LIMIT_BURST']
+        self.caps = app.config['CONCURRENCY_LIMITS']
+        self.slot_timeout = app.config['CONCURRENCY_SLOT_TIMEOUT']
+        app.extensions['limiter'] = self
+
+    def check(self, user_id):
+        # Seconds until the user may retry, or 0 when the request can go ahead
+        if self.rate <= 0:
+            return 0
+        school = current_school.get()
+        key = f'user:{school}:{user_id}' if school else f'user:{user_id}'
+        return self.store.take(key, self.rate, self.burst, time.time())
+
+    def acquire(self, scope):
+        # A slot to pass to release(), or None when the cap is reached
+        cap = self.caps.get(scope, 0)
+        if cap <= 0:
+            return 0
+        return self.store.acquire(scope, cap, time.time(), self.slot_timeout)
+
+    def release(self, scope, slot):
+        if slot:
+            self.store.release(scope, slot)
+
+def too_many_requests(message, retry_after):
+    response = jsonify({'message': message, 'retry_after': math.ceil(retry_after)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+def concurrency_limited(scope):
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            limiter = current_app.extensions.get('limiter')
+            if limiter is None:
+                return f(*args, **kwargs)
+            slot = limiter.acquire(scope)
+            if slot is None:
+                return too_many_requests(f'Too many {scope} requests in progress', 1)
+            try:
+                response = make_response(f(*args, **kwargs))
+            except BaseException:
+                limiter.release(scope, slot)
+                raise
+            return release_after(response, lambda: limiter.release(scope, slot))
+        return decorated
+    return decorator
+
+def release_after(response, release):
+    # Calls release() once the response has been sent. Streamed responses keep what
+    # they hold until the client has the whole body.
+    if not response.is_streamed:
+        release()
+        return response
+    release = _once(release)
+    response.response = _releasing(response.response, release)
+    # Still needed when the body is never read (HEAD, client gone before the first chunk)
+    response.call_on_close(release)
+    return response
+
+def _once(callback):
+    called = []
+    def call():
+        if not called:
+            called.append(True)
+            callback()
+    return call
+
+def _releasing(body, release):
+    # Not every server calls close() on the response (asgiref's WsgiToAsgi never does),
+    # so the end of the body gives the slot back as well
+    try:
+        yield from body
+    finally:
+        release()
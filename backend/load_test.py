@@ -0,0 +1,206 @@
+import argparse
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+BASE_URL = "http://127.0.0.1:5002/api"
+
+STATUSES = ['Present', 'Present', 'Present', 'Present', 'Absent', 'Late']
+SUBJECTS = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'History']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, elapsed, ok):
+        with self.lock:
+            self.latencies[route].append(elapsed)
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, duration):
+        print(f"\n{'Route':<40} {'Reqs':>7} {'Errs':>5} {'Req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        total = 0
+        for route in sorted(self.latencies):
+            samples = self.latencies[route]
+            total += len(samples)
+            print(f"{route:<40} {len(samples):>7} {self.errors[route]:>5} "
+                  f"{len(samples) / duration:>8.1f} "
+                  f"{percentile(samples, 50) * 1000:>8.1f} "
+                  f"{percentile(samples, 95) * 1000:>8.1f} "
+                  f"{percentile(samples, 99) * 1000:>8.1f} "
+                  f"{max(samples) * 1000:>8.1f}")
+        print(f"\nTotal: {total} requests in {duration:.1f}s ({total / duration:.1f} req/s)")
+
+
+class Teacher:
+    """Replays one teacher's roll call: open Attendance.jsx, pick students, submit bulk attendance."""
+
+    def __init__(self, base_url, stats, username, password, history_lookups):
+        self.base_url = base_url
+        self.stats = stats
+        self.username = username
+        self.password = password
+        self.history_lookups = history_lookups
+        self.session = requests.Session()
+
+    def call(self, route, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response = None
+            ok = False
+        self.stats.record(route, time.perf_counter() - start, ok)
+        return response
+
+    def login(self):
+        res = self.call('POST /auth/login', 'POST', '/auth/login', json={
+            "username": self.username,
+            "password": self.password
+        })
+        if res is None or res.status_code != 200:
+            return False
+        self.session.headers.update({'Authorization': f"Bearer {res.json()['token']}"})
+        return True
+
+    def roll_call(self, class_name, roll_date):
+        res = self.call('GET /students', 'GET', '/students')
+        if res is None or res.status_code != 200:
+            return
+        students = [s for s in res.json() if s['class_name'] == class_name]
+        if not students:
+            return
+
+        for student in random.sample(students, min(self.history_lookups, len(students))):
+            self.call('GET /attendance/student/<id>', 'GET', f"/attendance/student/{student['id']}")
+
+        self.call('POST /attendance/bulk', 'POST', '/attendance/bulk', json={
+            "date": roll_date,
+            "subject": random.choice(SUBJECTS),
+            "records": [{"student_id": s['id'], "status": random.choice(STATUSES)} for s in students]
+        })
+
+
+def throwaway_database():
+    # The run writes roll calls; give it a copy of the configured SQLite database so
+    # the real one (e.g. the dev database in backend/instance) is left untouched
+    from config import Config
+    url = Config.SQLALCHEMY_DATABASE_URI
+    if not url.startswith('sqlite:///'):
+        raise RuntimeError('--launch copies a SQLite database; point --base-url at a server for other databases')
+    copy = os.path.join(tempfile.mkdtemp(), 'load_test.db')
+    source, target = sqlite3.connect(url[len('sqlite:///'):]), sqlite3.connect(copy)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+    return 'sqlite:///' + copy
+
+
+def launch_gunicorn(port, workers, worker_class):
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    database_url = throwaway_database()
+    # Measure raw capacity: per-user rate limits would throttle the shared teacher account
+    process = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn',
+        '--chdir', backend_dir,
+        '--bind', f'127.0.0.1:{port}',
+        '--workers', str(workers),
+        '--worker-class', worker_class,
+        'app:create_app()'
+    ], env={**os.environ, 'LIMITS_ENABLED': '0', 'DATABASE_URL': database_url})
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.post(f"http://127.0.0.1:{port}/api/auth/login", json={"username": "", "password": ""}, timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError('gunicorn did not start within 30 seconds')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay the start-of-day roll-call burst against the API.')
+    parser.add_argument('--base-url', default=BASE_URL)
+    parser.add_argument('--teachers', type=int, default=20, help='number of concurrent teachers')
+    parser.add_argument('--rounds', type=int, default=5, help='roll calls submitted per teacher')
+    parser.add_argument('--history-lookups', type=int, default=3, help='attendance histories opened per roll call')
+    parser.add_argument('--username', default='teacher')
+    parser.add_argument('--password', default='teacher123')
+    parser.add_argument('--launch', action='store_true', help='start a local gunicorn instance on a throwaway copy of the database')
+    parser.add_argument('--port', type=int, default=5003)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--worker-class', default='sync')
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.base_url
+    if args.launch:
+        process = launch_gunicorn(args.port, args.workers, args.worker_class)
+        base_url = f"http://127.0.0.1:{args.port}/api"
+
+    try:
+        stats = Stats()
+        teachers = [Teacher(base_url, stats, args.username, args.password, args.history_lookups)
+                    for _ in range(args.teachers)]
+
+        probe = Teacher(base_url, Stats(), args.username, args.password, 0)
+        if not probe.login():
+            print(f"Login failed for {args.username}")
+            return 1
+        classes = sorted({s['class_name'] for s in probe.session.get(f"{base_url}/students").json()})
+        if not classes:
+            print("No students found. Run seed_mock_data.py first.")
+            return 1
+
+        def run_teacher(index):
+            teacher = teachers[index]
+            if not teacher.login():
+                return
+            class_name = classes[index % len(classes)]
+            for round_number in range(args.rounds):
+                # Spread rounds over past dates so reruns don't pile onto a single day
+                roll_date = (date.today() - timedelta(days=round_number)).isoformat()
+                teacher.roll_call(class_name, roll_date)
+
+        print(f"Replaying roll call: {args.teachers} teachers x {args.rounds} rounds against {base_url}")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.teachers) as executor:
+            list(executor.map(run_teacher, range(args.teachers)))
+        stats.report(time.perf_counter() - start)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
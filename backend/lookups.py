@@ -0,0 +1,119 @@
+import threading
+from sqlalchemy import case, event, types
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from database import PerSchool, db
+
+# Attendance status and subject names are stored as small integers. Models and
+# queries keep using the names: these column types translate them in process,
+# statuses from a fixed enum and subjects from a cache of the subject table, so
+# reads never join against the lookup table.
+
+STATUSES = ('Present', 'Absent', 'Late')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+class StatusType(types.TypeDecorator):
+    impl = types.SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        if value not in STATUS_CODES:
+            raise ValueError(f'Unknown attendance status: {value}')
+        return STATUS_CODES[value]
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else STATUSES[value]
+
+class SubjectType(types.TypeDecorator):
+    impl = types.Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        # Unknown names bind as NULL, so filters on them match nothing
+        if value is None or isinstance(value, int):
+            return value
+        return subjects.current().id(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else subjects.current().name(value)
+
+class SubjectCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.names = {}
+
+    def _load(self):
+        # Misses mean another process added a subject; reread the whole (small) table
+        from models import Subject
+        with db.engine.connect() as connection:
+            rows = connection.execute(db.select(Subject.id, Subject.name)).all()
+        with self.lock:
+            self.ids = {name: id for id, name in rows}
+            self.names = {id: name for id, name in rows}
+
+    def id(self, name):
+        if name not in self.ids:
+            self._load()
+        return self.ids.get(name)
+
+    def name(self, id):
+        if id not in self.names:
+            self._load()
+        return self.names.get(id)
+
+    def ensure(self, session, names):
+        # Adds missing subjects inside the session's transaction
+        from models import Subject
+        missing = {name for name in names if name is not None and name not in self.ids}
+        if missing:
+            self._load()
+            missing -= set(self.ids)
+        if not missing:
+            return
+
+        connection = session.connection()
+        insert = postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert
+        connection.execute(insert(Subject).on_conflict_do_nothing(index_elements=['name']), [{'name': name} for name in missing])
+        rows = connection.execute(db.select(Subject.id, Subject.name).where(Subject.name.in_(missing))).all()
+        with self.lock:
+            for id, name in rows:
+                self.ids[name] = id
+                self.names[id] = name
+        session.info.setdefault('new_subjects', set()).update(missing)
+
+    def forget(self, names):
+        with self.lock:
+            for name in names:
+                self.names.pop(self.ids.pop(name, None), None)
+
+# Subject ids are per database, so each school has its own cache
+subjects = PerSchool(lambda school: SubjectCache())
+
+def decoded(column):
+    # SQL expression giving the name stored in an encoded column, for rows built in the database
+    from models import Subject
+    if isinstance(column.type, StatusType):
+        return case({code: status for status, code in STATUS_CODES.items()}, value=column)
+    if isinstance(column.type, SubjectType):
+        return db.select(Subject.name).where(Subject.id == column).scalar_subquery()
+    return column
+
+@event.listens_for(Session, 'before_flush')
+def add_new_subjects(session, flush_context, instances):
+    names = {
+        obj.subject for obj in list(session.new) + list(session.dirty)
+        if isinstance(getattr(getattr(type(obj), 'subject', None), 'type', None), SubjectType)
+    }
+    subjects.current().ensure(session, names)
+
+@event.listens_for(Session, 'after_commit')
+def keep_new_subjects(session):
+    session.info.pop('new_subjects', None)
+
+@event.listens_for(Session, 'after_rollback')
+def drop_new_subjects(session):
+    # Ids handed out in a rolled-back transaction may be reused for other names
+    subjects.current().forget(session.info.pop('new_subjects', ()))
@@ -0,0 +1,107 @@
+from datetime import datetime
+from sqlalchemy.schema import AddConstraint, CreateTable
+from database import db
+from lookups import STATUS_CODES
+from models import SchemaMigration
+
+def rebuild_table(connection, table, foreign_keys, expressions=None):
+    # Recreate an existing table from its model definition, keeping the rows.
+    # SQLite can't alter constraints in place, so it follows the documented
+    # create-copy-drop-rename procedure; other databases swap the foreign keys on
+    # the columns listed in foreign_keys. The models describe the latest schema, so
+    # a migration must only touch the keys it introduces: the others may point at
+    # tables or column types a later migration creates.
+    # expressions maps column names to SQL computing their new value (SQLite only).
+    if connection.dialect.name == 'sqlite':
+        _rebuild_sqlite_table(connection, table, expressions or {})
+    else:
+        _replace_foreign_keys(connection, table, set(foreign_keys))
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+def _rebuild_sqlite_table(connection, table, expressions):
+    existing = {column['name'] for column in db.inspect(connection).get_columns(table.name)}
+    names = [column.name for column in table.columns if column.name in existing]
+    staging = table.to_metadata(db.metadata, name=f'_new_{table.name}')
+    try:
+        connection.execute(CreateTable(staging))
+    finally:
+        db.metadata.remove(staging)
+    columns = ', '.join(f'"{name}"' for name in names)
+    values = ', '.join(expressions.get(name, f'"{name}"') for name in names)
+    connection.exec_driver_sql(f'INSERT INTO "{staging.name}" ({columns}) SELECT {values} FROM "{table.name}"')
+    connection.exec_driver_sql(f'DROP TABLE "{table.name}"')
+    connection.exec_driver_sql(f'ALTER TABLE "{staging.name}" RENAME TO "{table.name}"')
+
+def _replace_foreign_keys(connection, table, columns):
+    for foreign_key in db.inspect(connection).get_foreign_keys(table.name):
+        if columns & set(foreign_key['constrained_columns']):
+            connection.exec_driver_sql(f'ALTER TABLE "{table.name}" DROP CONSTRAINT "{foreign_key["name"]}"')
+    for constraint in table.foreign_key_constraints:
+        if columns & set(constraint.column_keys):
+            connection.execute(AddConstraint(constraint))
+
+def cascade_student_foreign_keys(connection):
+    for table_name in ('student', 'attendance', 'grade'):
+        foreign_keys = ('created_by',) if table_name == 'student' else ('student_id', 'created_by')
+        rebuild_table(connection, db.metadata.tables[table_name], foreign_keys)
+
+def index_record_dates(connection):
+    for table_name in ('attendance', 'grade'):
+        for index in db.metadata.tables[table_name].indexes:
+            index.create(connection, checkfirst=True)
+
+def encode_status_and_subjects(connection):
+    unknown = set(connection.exec_driver_sql('SELECT DISTINCT status FROM attendance').scalars()) - set(STATUS_CODES)
+    if unknown:
+        raise RuntimeError(f'Attendance has unsupported statuses {sorted(unknown)}; correct them before migrating')
+
+    connection.exec_driver_sql('INSERT INTO subject (name) SELECT subject FROM attendance UNION SELECT subject FROM grade')
+    status = 'CASE status ' + ' '.join(f"WHEN '{name}' THEN {code}" for name, code in STATUS_CODES.items()) + ' END'
+
+    if connection.dialect.name == 'sqlite':
+        for table_name in ('attendance', 'grade'):
+            expressions = {'subject': f'(SELECT id FROM subject WHERE subject.name = "{table_name}".subject)'}
+            if table_name == 'attendance':
+                expressions['status'] = status
+            rebuild_table(connection, db.metadata.tables[table_name], ('subject',), expressions)
+        return
+
+    for table_name in ('attendance', 'grade'):
+        connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN subject_id INTEGER')
+        connection.exec_driver_sql(f'UPDATE {table_name} SET subject_id = subject.id FROM subject WHERE subject.name = {table_name}.subject')
+        connection.exec_driver_sql(f'ALTER TABLE {table_name} DROP COLUMN subject')
+        connection.exec_driver_sql(f'ALTER TABLE {table_name} RENAME COLUMN subject_id TO subject')
+        connection.exec_driver_sql(f'ALTER TABLE {table_name} ALTER COLUMN subject SET NOT NULL')
+        rebuild_table(connection, db.metadata.tables[table_name], ('subject',))
+    connection.exec_driver_sql(f'ALTER TABLE attendance ALTER COLUMN status TYPE SMALLINT USING {status}')
+
+# Applied in order by bootstrap(); each name is recorded in schema_migration once it has run.
+# Databases created from scratch by create_all() already match the models and skip them.
+MIGRATIONS = [
+    ('0001_cascade_student_foreign_keys', cascade_student_foreign_keys),
+    ('0002_index_record_dates', index_record_dates),
+    ('0003_encode_status_and_subjects', encode_status_and_subjects),
+]
+
+def run_migrations(fresh):
+    with db.engine.connect() as connection:
+        applied = set(connection.execute(db.select(SchemaMigration.name)).scalars())
+        pending = [(name, upgrade) for name, upgrade in MIGRATIONS if name not in applied]
+        if not pending:
+            return
+
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            # Must be set outside a transaction; otherwise dropping a parent table cascades into its children
+            connection.commit()
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        try:
+            for name, upgrade in pending:
+                if not fresh:
+                    upgrade(connection)
+                connection.execute(db.insert(SchemaMigration).values(name=name, applied_at=datetime.utcnow()))
+                connection.commit()
+        finally:
+            if sqlite:
+                connection.exec_driver_sql('PRAGMA foreign_keys=ON')
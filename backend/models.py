@@ -1,5 +1,7 @@
+import re
 from database import db
 from datetime import datetime
+from lookups import StatusType, SubjectType
 from werkzeug.security import generate_password_hash, check_password_hash
 
 role_permission = db.Table('role_permission',
@@ -7,6 +9,8 @@ role_permission = db.Table('role_permission',
     db.Column('permission_id', db.Integer, db.ForeignKey('permission.id'), primary_key=True)
 )
 
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -46,29 +50,105 @@ class Student(db.Model):
     student_id = db.Column(db.String(20), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    class_name = db.Column(db.String(50), nullable=False)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    class_name = db.Column(db.String(50), nullable=False, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    attendance = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan')
-    grades = db.relationship('Grade', backref='student', lazy=True, cascade='all, delete-orphan')
+    # Child rows are removed by ON DELETE CASCADE in the database, not loaded and deleted by the ORM
+    attendance = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    grades = db.relationship('Grade', backref='student', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+class Subject(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    status = db.Column(db.String(10), nullable=False)
-    subject = db.Column(db.String(50), nullable=False)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False, index=True)
+    date = db.Column(db.Date, nullable=False, index=True)
+    # Read and written as names; stored as a status code and a subject id (see lookups.py)
+    status = db.Column(StatusType, nullable=False)
+    subject = db.Column(SubjectType, db.ForeignKey('subject.id'), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Grade(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
-    subject = db.Column(db.String(50), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False, index=True)
+    subject = db.Column(SubjectType, db.ForeignKey('subject.id'), nullable=False)
     assignment = db.Column(db.String(100), nullable=False)
     score = db.Column(db.Float, nullable=False)
     max_score = db.Column(db.Float, nullable=False)
-    date = db.Column(db.Date, nullable=False)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    date = db.Column(db.Date, nullable=False, index=True)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChangeLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)
+    # Row values after the change (before it, for deletes)
+    snapshot = db.Column(db.JSON)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_change_log_entity_id', 'entity', 'id'),)
+
+class SyncCursor(db.Model):
+    # Last change_log id folded into a derived table, per consumer
+    name = db.Column(db.String(50), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+class SyncBatch(db.Model):
+    # Results of an applied /api/sync batch, so a client retrying after a lost response
+    # gets the same answer instead of applying its changes twice
+    id = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    results = db.Column(db.JSON, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class GradeWeight(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # None holds the weights for subjects that have none of their own
+    subject = db.Column(SubjectType, db.ForeignKey('subject.id'))
+    category = db.Column(db.String(20), nullable=False)
+    weight = db.Column(db.Float, nullable=False)
+
+class GradeTotal(db.Model):
+    # Running count and percentage sum per (student, term, subject, category); see grading.py
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), nullable=False)
+    # None for grades dated outside every term
+    term_id = db.Column(db.Integer, db.ForeignKey('term.id', ondelete='CASCADE'))
+    subject = db.Column(SubjectType, db.ForeignKey('subject.id'), nullable=False)
+    category = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    percentage_sum = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (db.Index('ix_grade_total_student_term', 'student_id', 'term_id'),)
+
+class AbsenceStreak(db.Model):
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id', ondelete='CASCADE'), primary_key=True)
+    # Consecutive most recent marked days on which every record was Absent
+    streak = db.Column(db.Integer, nullable=False, default=0)
+    streak_start = db.Column(db.Date)
+    last_date = db.Column(db.Date, nullable=False)
+
+class Term(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    # Set once the term's attendance and grades have been moved to the on-disk archive
+    archived_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SchemaMigration(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SchemaVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), unique=True, nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
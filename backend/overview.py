@@ -0,0 +1,145 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import case, func
+from database import db
+from lookups import STATUSES
+from models import Student, Attendance, Grade, ChangeLog, Term
+
+# Everything the student detail view shows, from five queries however long the
+# student's history is: the profile, attendance counts by subject and status,
+# grade averages by subject, and the latest attendance and grade records. As in the
+# other views without a start_date, archived terms are left out.
+
+def _rate(counts):
+    return round(counts['Present'] / counts['total'] * 100, 2) if counts['total'] else 0
+
+def build_overview(student_id, recent):
+    student = db.session.execute(
+        db.select(Student.id, Student.student_id, Student.name, Student.email, Student.class_name)
+        .where(Student.id == student_id)
+    ).first()
+    if student is None:
+        return None
+
+    by_subject = {}
+    overall = {'total': 0, **{status: 0 for status in STATUSES}}
+    for subject, status, count in db.session.execute(
+        db.select(Attendance.subject, Attendance.status, func.count(Attendance.id))
+        .where(Attendance.student_id == student_id)
+        .group_by(Attendance.subject, Attendance.status)
+    ):
+        counts = by_subject.setdefault(subject, {'total': 0, **{s: 0 for s in STATUSES}})
+        for bucket in (counts, overall):
+            bucket[status] += count
+            bucket['total'] += count
+
+    percentage = case((Grade.max_score > 0, Grade.score / Grade.max_score * 100), else_=0)
+    grade_rows = db.session.execute(
+        db.select(
+            Grade.subject,
+            func.count(Grade.id).label('assignments'),
+            func.avg(percentage).label('average'),
+            func.min(percentage).label('lowest'),
+            func.max(percentage).label('highest')
+        )
+        .where(Grade.student_id == student_id)
+        .group_by(Grade.subject)
+    ).all()
+    assignments = sum(row.assignments for row in grade_rows)
+
+    recent_attendance = db.session.execute(
+        db.select(Attendance.id, Attendance.date, Attendance.status, Attendance.subject)
+        .where(Attendance.student_id == student_id)
+        .order_by(Attendance.date.desc(), Attendance.id.desc())
+        .limit(recent)
+    ).all()
+    recent_grades = db.session.execute(
+        db.select(Grade.id, Grade.subject, Grade.assignment, Grade.score, Grade.max_score, Grade.date)
+        .where(Grade.student_id == student_id)
+        .order_by(Grade.date.desc(), Grade.id.desc())
+        .limit(recent)
+    ).all()
+
+    return {
+        'student': student._asdict(),
+        'attendance': {
+            **overall,
+            'attendance_rate': _rate(overall),
+            'subjects': [{'subject': subject, **counts, 'attendance_rate': _rate(counts)} for subject, counts in sorted(by_subject.items())]
+        },
+        'grades': {
+            'assignments': assignments,
+            'average_grade': round(sum(row.average * row.assignments for row in grade_rows) / assignments, 2) if assignments else None,
+            'subjects': [{
+                'subject': row.subject,
+                'assignments': row.assignments,
+                'average': round(row.average, 2),
+                'lowest': round(row.lowest, 2),
+                'highest': round(row.highest, 2)
+            } for row in sorted(grade_rows, key=lambda row: row.subject)]
+        },
+        'recent_attendance': [{
+            'id': row.id,
+            'date': row.date.isoformat(),
+            'status': row.status,
+            'subject': row.subject
+        } for row in recent_attendance],
+        'recent_grades': [{
+            'id': row.id,
+            'subject': row.subject,
+            'assignment': row.assignment,
+            'score': row.score,
+            'max_score': row.max_score,
+            'percentage': round((row.score / row.max_score * 100), 2) if row.max_score > 0 else 0,
+            'date': row.date.isoformat()
+        } for row in recent_grades]
+    }
+
+class StudentOverviews:
+    # Per-process cache of overviews, dropped only for students whose row, attendance
+    # or grades appear in the change log since it was built
+
+    def __init__(self, max_students=5000):
+        self.lock = threading.Lock()
+        self.by_student = OrderedDict()
+        self.max_students = max_students
+        self.position = None
+        self.archived_terms = None
+
+    def _invalidate(self):
+        watermark, archived_terms = db.session.execute(db.select(
+            db.select(func.max(ChangeLog.id)).scalar_subquery(),
+            # Archiving removes rows without logging them, so it drops everything
+            db.select(func.count(Term.id)).where(Term.archived_at.isnot(None)).scalar_subquery()
+        )).one()
+        watermark = watermark or 0
+        if self.position is None or archived_terms != self.archived_terms:
+            self.by_student.clear()
+            self.position = watermark
+            self.archived_terms = archived_terms
+            return
+        if watermark <= self.position:
+            return
+
+        changes = db.session.execute(
+            db.select(ChangeLog.entity, ChangeLog.entity_id, ChangeLog.snapshot)
+            .where(ChangeLog.entity.in_(['student', 'attendance', 'grade']), ChangeLog.id > self.position, ChangeLog.id <= watermark)
+        ).all()
+        self.position = watermark
+        for entity, entity_id, row in changes:
+            self.by_student.pop(entity_id if entity == 'student' else row['student_id'], None)
+
+    def get(self, student_id, recent):
+        with self.lock:
+            self._invalidate()
+            cached = self.by_student.get(student_id, {})
+            if recent not in cached:
+                overview = build_overview(student_id, recent)
+                if overview is None:
+                    return None
+                cached[recent] = overview
+                self.by_student[student_id] = cached
+            self.by_student.move_to_end(student_id)
+            while len(self.by_student) > self.max_students:
+                self.by_student.popitem(last=False)
+            return cached[recent]
@@ -0,0 +1,123 @@
+import threading
+from sqlalchemy import case, func
+from database import db
+from models import Student, Grade, ChangeLog, Term
+
+HISTOGRAM_BINS = 10
+
+def compute_rankings(class_names=None, subject=None):
+    # Per (class, subject): each student's mean score/max_score, ranked with window functions
+    averages = (
+        db.select(
+            Student.class_name,
+            Grade.subject,
+            Student.id.label('id'),
+            Student.student_id,
+            Student.name,
+            func.avg(case((Grade.max_score > 0, Grade.score / Grade.max_score))).label('average'),
+            func.count(Grade.id).label('assignments')
+        )
+        .join(Student, Student.id == Grade.student_id)
+        .group_by(Student.class_name, Grade.subject, Student.id, Student.student_id, Student.name)
+    )
+    if class_names is not None:
+        averages = averages.where(Student.class_name.in_(class_names))
+    if subject:
+        averages = averages.where(Grade.subject == subject)
+    averages = averages.subquery()
+
+    partition = (averages.c.class_name, averages.c.subject)
+    rows = db.session.execute(
+        db.select(
+            averages,
+            func.rank().over(partition_by=partition, order_by=averages.c.average.desc()).label('rank'),
+            func.percent_rank().over(partition_by=partition, order_by=averages.c.average).label('percentile')
+        )
+        .order_by(averages.c.average.desc(), averages.c.name)
+    )
+
+    groups = {}
+    for row in rows:
+        group = groups.get((row.class_name, row.subject))
+        if group is None:
+            group = groups[(row.class_name, row.subject)] = {
+                'class_name': row.class_name,
+                'subject': row.subject,
+                'students': [],
+                'histogram': [0] * HISTOGRAM_BINS
+            }
+        average = (row.average or 0) * 100
+        group['students'].append({
+            'id': row.id,
+            'student_id': row.student_id,
+            'student_name': row.name,
+            'assignments': row.assignments,
+            'average': round(average, 2),
+            'rank': row.rank,
+            'percentile': round(float(row.percentile) * 100, 2)
+        })
+        group['histogram'][max(0, min(int(average // (100 / HISTOGRAM_BINS)), HISTOGRAM_BINS - 1))] += 1
+
+    for group in groups.values():
+        scores = [student['average'] for student in group['students']]
+        group['mean'] = round(sum(scores) / len(scores), 2)
+    # Subjects are stored as ids, so order groups by name here rather than in SQL
+    return [groups[key] for key in sorted(groups)]
+
+class GradeRankings:
+    # Per-process cache of rankings by class, dropped only for classes whose
+    # grades (or students) appear in the change log since it was built
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_class = {}
+        self.position = None
+        self.archived_terms = None
+
+    def _invalidate(self):
+        watermark, archived_terms = db.session.execute(db.select(
+            db.select(func.max(ChangeLog.id)).scalar_subquery(),
+            # Archiving removes grades without logging them, so it drops everything
+            db.select(func.count(Term.id)).where(Term.archived_at.isnot(None)).scalar_subquery()
+        )).one()
+        watermark = watermark or 0
+        if self.position is None or archived_terms != self.archived_terms:
+            self.by_class.clear()
+            self.position = watermark
+            self.archived_terms = archived_terms
+            return
+        if watermark <= self.position:
+            return
+
+        changes = db.session.execute(
+            db.select(ChangeLog.entity, ChangeLog.snapshot)
+            .where(ChangeLog.entity.in_(['grade', 'student']), ChangeLog.id > self.position, ChangeLog.id <= watermark)
+        ).all()
+        self.position = watermark
+        if any(entity == 'student' for entity, _ in changes):
+            # Students moving between classes change two classes' rankings; rare enough to drop everything
+            self.by_class.clear()
+            return
+        student_ids = {row['student_id'] for _, row in changes}
+        if student_ids:
+            for (class_name,) in db.session.execute(
+                db.select(Student.class_name).distinct().where(Student.id.in_(student_ids))
+            ):
+                self.by_class.pop(class_name, None)
+
+    def get(self, class_name=None, subject=None):
+        with self.lock:
+            self._invalidate()
+            if class_name:
+                classes = [class_name]
+            else:
+                classes = db.session.execute(db.select(Student.class_name).distinct().order_by(Student.class_name)).scalars().all()
+            missing = [c for c in classes if c not in self.by_class]
+            if missing:
+                fresh = {}
+                for group in compute_rankings(missing):
+                    fresh.setdefault(group['class_name'], []).append(group)
+                for c in missing:
+                    self.by_class[c] = fresh.get(c, [])
+            groups = [group for c in classes for group in self.by_class[c]]
+        return [group for group in groups if not subject or group['subject'] == subject]
@@ -0,0 +1,214 @@
+import argparse
+import fcntl
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from sqlalchemy import case, func
+from archive import archived_rows
+from database import db
+from models import Student, Attendance, Grade
+from tenants import school_context, school_dir
+
+# End-of-term report cards, one partition per class_name. Each partition runs in
+# its own process with its own app and database connection; the parent only
+# writes the per-class JSON artifacts and an index.json describing the run.
+
+def class_report(class_name, start_date=None, end_date=None):
+    students = db.session.execute(
+        db.select(Student.id, Student.student_id, Student.name)
+        .where(Student.class_name == class_name)
+        .order_by(Student.name)
+    ).all()
+
+    attendance = db.select(Attendance.student_id, Attendance.status, func.count(Attendance.id)).join(
+        Student, Student.id == Attendance.student_id
+    ).where(Student.class_name == class_name).group_by(Attendance.student_id, Attendance.status)
+    grades = db.select(
+        Grade.student_id,
+        Grade.subject,
+        func.count(Grade.id),
+        func.sum(case((Grade.max_score > 0, Grade.score / Grade.max_score * 100), else_=0))
+    ).join(Student, Student.id == Grade.student_id).where(Student.class_name == class_name).group_by(Grade.student_id, Grade.subject)
+    if start_date:
+        attendance = attendance.where(Attendance.date >= start_date)
+        grades = grades.where(Grade.date >= start_date)
+    if end_date:
+        attendance = attendance.where(Attendance.date <= end_date)
+        grades = grades.where(Grade.date <= end_date)
+
+    statuses = {}
+    for student_id, status, count in db.session.execute(attendance):
+        statuses.setdefault(student_id, {})[status] = count
+    subjects = {}
+    for student_id, subject, count, percentage_sum in db.session.execute(grades):
+        subjects.setdefault(student_id, {})[subject] = [count, percentage_sum]
+
+    # Archived terms are merged here; only reached when start_date goes back that far
+    if start_date:
+        ids = {id for id, _, _ in students}
+        for row in archived_rows('attendance', start_date, end_date):
+            if row['student_id'] in ids:
+                counts = statuses.setdefault(row['student_id'], {})
+                counts[row['status']] = counts.get(row['status'], 0) + 1
+        for row in archived_rows('grade', start_date, end_date):
+            if row['student_id'] in ids:
+                totals = subjects.setdefault(row['student_id'], {}).setdefault(row['subject'], [0, 0])
+                totals[0] += 1
+                totals[1] += row['score'] / row['max_score'] * 100 if row['max_score'] > 0 else 0
+
+    cards = []
+    for id, student_id, name in students:
+        counts = statuses.get(id, {})
+        total = sum(counts.values())
+        student_subjects = subjects.get(id, {})
+        assignments = sum(count for count, _ in student_subjects.values())
+        cards.append({
+            'student_id': student_id,
+            'student_name': name,
+            'attendance': {
+                'total': total,
+                'present': counts.get('Present', 0),
+                'late': counts.get('Late', 0),
+                'absent': counts.get('Absent', 0),
+                'attendance_rate': round(counts.get('Present', 0) / total * 100, 2) if total else 0
+            },
+            'grades': {
+                subject: {'assignments': count, 'average_grade': round(percentage_sum / count, 2)}
+                for subject, (count, percentage_sum) in sorted(student_subjects.items())
+            },
+            'average_grade': round(sum(p for _, p in student_subjects.values()) / assignments, 2) if assignments else None
+        })
+    return {'class_name': class_name, 'students': cards}
+
+_worker_app = None
+
+def _init_worker():
+    global _worker_app
+    # Workers only read; the schema was bootstrapped by the parent
+    os.environ['AUTO_BOOTSTRAP'] = '0'
+    from app import create_app
+    _worker_app = create_app()
+
+def _run_partition(school, class_name, start_date, end_date):
+    started = time.perf_counter()
+    with school_context(_worker_app, school):
+        report = class_report(class_name, start_date, end_date)
+    return report, time.perf_counter() - started
+
+def generate_reports(directory, class_names, start_date=None, end_date=None, workers=None, run_id=None, school=None):
+    run_id = run_id or uuid.uuid4().hex[:12]
+    path = os.path.join(directory, run_id)
+    os.makedirs(path, exist_ok=True)
+    index = {
+        'id': run_id,
+        'school': school,
+        'status': 'running',
+        'start_date': start_date.isoformat() if start_date else None,
+        'end_date': end_date.isoformat() if end_date else None,
+        'workers': workers or os.cpu_count(),
+        'created_at': datetime.utcnow().isoformat(),
+        'classes': {}
+    }
+    _write_json(os.path.join(path, 'index.json'), index)
+
+    started = time.perf_counter()
+    # spawn, not fork: the caller may be a threaded gunicorn worker holding DB connections
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=index['workers'], mp_context=context, initializer=_init_worker) as pool:
+            futures = {pool.submit(_run_partition, school, c, start_date, end_date): c for c in class_names}
+            for number, future in enumerate(as_completed(futures)):
+                class_name = futures[future]
+                report, seconds = future.result()
+                filename = f'class-{number}.json'
+                _write_json(os.path.join(path, filename), report)
+                index['classes'][class_name] = {'file': filename, 'students': len(report['students']), 'seconds': round(seconds, 3)}
+    except Exception as e:
+        index['status'] = 'failed'
+        index['error'] = str(e)
+        _write_json(os.path.join(path, 'index.json'), index)
+        raise
+
+    index['status'] = 'complete'
+    index['seconds'] = round(time.perf_counter() - started, 3)
+    _write_json(os.path.join(path, 'index.json'), index)
+    return index
+
+def start_reports(directory, class_names, start_date=None, end_date=None, workers=None, school=None):
+    # Runs generate_reports in the background; progress is read back from index.json.
+    # Each run already uses every CPU, so a directory (school) gets one at a time across
+    # all workers on the host: returns (run id, True), or (the active run's id, False).
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, 'run.lock'), 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.seek(0)
+        active = lock_file.read().strip()
+        lock_file.close()
+        return active, False
+
+    run_id = uuid.uuid4().hex[:12]
+    lock_file.truncate(0)
+    lock_file.write(run_id)
+    lock_file.flush()
+    os.makedirs(os.path.join(directory, run_id), exist_ok=True)
+    _write_json(os.path.join(directory, run_id, 'index.json'), {'id': run_id, 'status': 'running', 'classes': {}})
+
+    def run():
+        # The lock also goes away with the process if it dies mid-run
+        try:
+            generate_reports(directory, class_names, start_date, end_date, workers, run_id, school)
+        finally:
+            lock_file.close()
+
+    threading.Thread(target=run, name=f'report-{run_id}', daemon=True).start()
+    return run_id, True
+
+def _write_json(path, data):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+def read_report(directory, run_id, filename='index.json'):
+    # run_id comes from the URL; only accept what generate_reports writes
+    if not run_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(directory, run_id, filename)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate per-class report cards in parallel.')
+    parser.add_argument('--start-date')
+    parser.add_argument('--end-date')
+    parser.add_argument('--class-name', action='append', dest='class_names')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--school', help='one of SCHOOLS; defaults to the main database')
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with school_context(app, args.school):
+        directory = school_dir(app.config['REPORTS_DIR'])
+        class_names = args.class_names or db.session.execute(
+            db.select(Student.class_name).distinct().order_by(Student.class_name)
+        ).scalars().all()
+
+    index = generate_reports(
+        directory,
+        class_names,
+        start_date=datetime.strptime(args.start_date, '%Y-%m-%d').date() if args.start_date else None,
+        end_date=datetime.strptime(args.end_date, '%Y-%m-%d').date() if args.end_date else None,
+        workers=args.workers,
+        school=args.school
+    )
+    print(f"Report {index['id']}: {len(index['classes'])} classes in {index['seconds']}s with {index['workers']} workers")
+    print(f"Written to {os.path.join(directory, index['id'])}")
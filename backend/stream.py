@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from datetime import date
+from database import db
+from models import Student, Attendance, ChangeLog
+from tenants import school_context
+
+Event = namedtuple('Event', ['seq', 'class_name', 'subject', 'payload'])
+
+class AttendanceFeed:
+    # Tails the change log once per worker process and fans attendance changes out to
+    # every SSE subscriber in it. Subscribers only hold a cursor into a shared, bounded
+    # ring buffer, so idle connections cost no queue memory and no extra queries.
+
+    def __init__(self, app, school=None, buffer_size=2000, poll_interval=1.0):
+        self.app = app
+        self.school = school
+        self.poll_interval = poll_interval
+        self.events = deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.latest = 0
+        self.evicted_through = 0
+        self.thread = None
+        self.pid = None
+        self.progress_date = None
+        self.marked = defaultdict(set)
+        self.class_sizes = {}
+        self.student_classes = {}
+
+    def ensure_started(self):
+        # Threads don't survive gunicorn's fork, so start lazily inside each worker
+        with self.condition:
+            if self.thread and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            with school_context(self.app, self.school):
+                self.latest = db.session.execute(db.select(db.func.max(ChangeLog.id))).scalar() or 0
+                # Anything up to here predates the buffer; older Last-Event-IDs get a reset
+                self.evicted_through = self.latest
+                self._load_progress(date.today())
+            self.thread = threading.Thread(target=self._run, name='attendance-feed', daemon=True)
+            self.thread.start()
+
+    def _load_progress(self, day):
+        self.progress_date = day
+        self.class_sizes = dict(db.session.execute(
+            db.select(Student.class_name, db.func.count(Student.id)).group_by(Student.class_name)
+        ).all())
+        self.student_classes = dict(db.session.execute(db.select(Student.id, Student.class_name)).all())
+        self.marked = defaultdict(set)
+        for class_name, student_id in db.session.execute(
+            db.select(Student.class_name, Attendance.student_id).distinct()
+            .join(Student, Student.id == Attendance.student_id)
+            .where(Attendance.date == day)
+        ):
+            self.marked[class_name].add(student_id)
+
+    def progress(self, class_name=None):
+        with self.condition:
+            classes = [class_name] if class_name else sorted(self.class_sizes)
+            return {
+                'date': self.progress_date.isoformat(),
+                'classes': {c: {'marked': len(self.marked.get(c, ())), 'total': self.class_sizes.get(c, 0)} for c in classes}
+            }
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with school_context(self.app, self.school):
+                    self._poll()
+                    db.session.remove()
+            except Exception:
+                self.app.logger.exception('Attendance feed poll failed')
+
+    def _poll(self):
+        rows = db.session.execute(
+            db.select(ChangeLog.id, ChangeLog.operation, ChangeLog.snapshot)
+            .where(ChangeLog.entity == 'attendance', ChangeLog.id > self.latest)
+            .order_by(ChangeLog.id)
+            .limit(1000)
+        ).all()
+        today = date.today()
+        if today != self.progress_date or any(r.snapshot['student_id'] not in self.student_classes for r in rows):
+            with self.condition:
+                self._load_progress(today)
+        if not rows:
+            return
+
+        with self.condition:
+            for seq, operation, row in rows:
+                class_name = self.student_classes.get(row['student_id'])
+                delta = {
+                    'op': operation,
+                    'id': row['id'],
+                    'student_id': row['student_id'],
+                    'class_name': class_name,
+                    'date': row['date'],
+                    'subject': row['subject'],
+                    'status': row['status']
+                }
+                if row['date'] == today.isoformat() and operation != 'delete' and class_name:
+                    self.marked[class_name].add(row['student_id'])
+                    delta['progress'] = {'marked': len(self.marked[class_name]), 'total': self.class_sizes.get(class_name, 0)}
+                if len(self.events) == self.events.maxlen:
+                    self.evicted_through = self.events[0].seq
+                # Serialized once here and shared by every subscriber
+                self.events.append(Event(seq, class_name, row['subject'], json.dumps(delta)))
+            self.latest = rows[-1].id
+            self.condition.notify_all()
+
+    def wait(self, cursor, timeout):
+        # Returns (events after cursor, new cursor, whether the subscriber fell behind the buffer)
+        with self.condition:
+            if self.latest <= cursor:
+                self.condition.wait(timeout)
+            if cursor < self.evicted_through:
+                return [], self.latest, True
+            new = []
+            for event in reversed(self.events):
+                if event.seq <= cursor:
+                    break
+                new.append(event)
+            new.reverse()
+            return new, self.latest, False
@@ -0,0 +1,290 @@
+from datetime import date, datetime, timedelta
+from changelog import changes_since, current_watermark, log_student_deletes
+from database import db
+from lookups import STATUSES
+from models import EMAIL_PATTERN, Student, Attendance, Grade, ChangeLog, SyncBatch
+
+# Offline-first sync for teacher clients. A client keeps the rows it has seen and a
+# queue of local writes; POST /api/sync sends the token from its last sync plus that
+# queue. The writes are applied in one transaction and the answer holds only the rows
+# changed since the token, with the token to send next time.
+#
+# Tokens are change log watermarks and double as row versions: a client's copy of a
+# row is current as of the token that delivered it. An update or delete of a row that
+# has changed since that version is a conflict and is skipped; the server's copy of
+# the row comes back in the changes like any other.
+
+MODELS = {'student': Student, 'attendance': Attendance, 'grade': Grade}
+PERMISSIONS = {'student': 'manage_students', 'attendance': 'manage_attendance', 'grade': 'manage_grades'}
+FIELDS = {
+    'student': ('student_id', 'name', 'email', 'class_name'),
+    'attendance': ('student_id', 'date', 'status', 'subject'),
+    'grade': ('student_id', 'subject', 'assignment', 'score', 'max_score', 'date')
+}
+MAX_CHANGES = 500
+BATCH_RETENTION = timedelta(days=30)
+
+class SyncError(ValueError):
+    pass
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+def _student_ref(value):
+    # How parse_values reads the student_id of attendance and grades: an integer or a
+    # string of digits. Anything else (1.9, true) could silently name another student.
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    raise ValueError(value)
+
+def parse_values(entity, data, partial):
+    # Validated column values for an insert (every field) or update (any subset)
+    if not partial:
+        missing = [field for field in FIELDS[entity] if data.get(field) in (None, '')]
+        if missing:
+            raise SyncError(f'Missing {", ".join(missing)}')
+
+    values = {}
+    for field in FIELDS[entity]:
+        if field not in data:
+            continue
+        value = data[field]
+        if value in (None, ''):
+            raise SyncError(f'{field} cannot be empty')
+        try:
+            if field == 'date':
+                value = datetime.strptime(value, '%Y-%m-%d').date()
+            elif field in ('score', 'max_score'):
+                value = float(value)
+            elif field == 'student_id' and entity != 'student':
+                value = _student_ref(value)
+            elif not isinstance(value, str):
+                raise TypeError(field)
+        except (TypeError, ValueError):
+            raise SyncError(f'Invalid {field}')
+        if field in ('score', 'max_score') and value < 0:
+            raise SyncError(f'{field} cannot be negative')
+        if field == 'status' and value not in STATUSES:
+            raise SyncError(f'status must be one of {", ".join(STATUSES)}')
+        if field == 'email' and not EMAIL_PATTERN.match(value):
+            raise SyncError('Invalid email format')
+        values[field] = value
+    return values
+
+class ChangeBatch:
+    # Applies one client's queued changes inside the current transaction
+
+    def __init__(self, user, changes):
+        self.user = user
+        self.changes = changes
+        self.inserted = []
+
+        # One query per table for everything the checks below need
+        self.versions = self._versions()
+        self.rows = {}
+        for entity, model in MODELS.items():
+            ids = {c['id'] for c in changes if c['entity'] == entity and c['op'] != 'insert'}
+            if ids:
+                self.rows.update({(entity, obj.id): obj for obj in model.query.filter(model.id.in_(ids))})
+
+        new_students = [c.get('data') or {} for c in changes if c['entity'] == 'student']
+        codes = {data['student_id'] for data in new_students if isinstance(data.get('student_id'), str)}
+        emails = {data['email'] for data in new_students if isinstance(data.get('email'), str)}
+        self.codes, self.emails = {}, {}
+        for id, code, email in db.session.execute(
+            db.select(Student.id, Student.student_id, Student.email)
+            .where(db.or_(Student.student_id.in_(codes), Student.email.in_(emails)))
+        ):
+            self.codes[code] = id
+            self.emails[email] = id
+
+        student_ids = set()
+        for change in changes:
+            if change['entity'] != 'student' and (change.get('data') or {}).get('student_id') is not None:
+                try:
+                    student_ids.add(_student_ref(change['data']['student_id']))
+                except (TypeError, ValueError):
+                    pass  # rejected by parse_values
+        self.student_ids = set(db.session.execute(
+            db.select(Student.id).where(Student.id.in_(student_ids))
+        ).scalars()) if student_ids else set()
+
+    def _versions(self):
+        # Latest change log id after each change's base version, for rows changed since then
+        versions = {}
+        for entity in MODELS:
+            edits = [c for c in self.changes if c['entity'] == entity and c['op'] != 'insert']
+            if not edits:
+                continue
+            rows = db.session.execute(
+                db.select(ChangeLog.entity_id, db.func.max(ChangeLog.id))
+                .where(
+                    ChangeLog.entity == entity,
+                    ChangeLog.id > min(c['base_version'] for c in edits),
+                    ChangeLog.entity_id.in_({c['id'] for c in edits})
+                )
+                .group_by(ChangeLog.entity_id)
+            )
+            versions.update({(entity, id): version for id, version in rows})
+        return versions
+
+    def apply(self):
+        results = []
+        for index, change in enumerate(self.changes):
+            result = {'index': index}
+            if change.get('client_id') is not None:
+                result['client_id'] = change['client_id']
+            if change['op'] != 'insert':
+                result['id'] = change['id']
+            try:
+                self._apply(change, result)
+            except SyncError as e:
+                result.update(status='rejected', error=str(e))
+            results.append(result)
+
+        # Inserted rows get their ids in one flush at the end
+        db.session.flush()
+        for result, obj in self.inserted:
+            result['id'] = obj.id
+        return results
+
+    def _apply(self, change, result):
+        entity, op = change['entity'], change['op']
+        model = MODELS[entity]
+        if not self.user.has_permission(PERMISSIONS[entity]):
+            raise SyncError('Insufficient permissions')
+
+        if op == 'insert':
+            values = parse_values(entity, change.get('data') or {}, partial=False)
+            self._check_references(entity, values, None)
+            obj = model(**values, created_by=self.user.id)
+            db.session.add(obj)
+            result['status'] = 'applied'
+            self.inserted.append((result, obj))
+            return
+
+        obj = self.rows.get((entity, change['id']))
+        if op == 'delete' and obj is None:
+            # Already gone, which is what the client wanted
+            result['status'] = 'applied'
+            return
+        version = self.versions.get((entity, change['id']), 0)
+        if version > change['base_version']:
+            result.update(status='conflict', version=version)
+            return
+
+        if op == 'delete':
+            self._delete(entity, obj)
+        else:
+            if obj is None:
+                raise SyncError(f'{entity} {change["id"]} does not exist')
+            values = parse_values(entity, change.get('data') or {}, partial=True)
+            self._check_references(entity, values, obj.id)
+            for field, value in values.items():
+                setattr(obj, field, value)
+        result['status'] = 'applied'
+
+    def _check_references(self, entity, values, id):
+        if entity == 'student':
+            # Rows inserted by this batch have no id yet but still own their values
+            owner = id if id is not None else object()
+            if self.codes.get(values.get('student_id'), owner) != owner:
+                raise SyncError('Student ID already exists')
+            if self.emails.get(values.get('email'), owner) != owner:
+                raise SyncError('Email already exists')
+            if 'student_id' in values:
+                self.codes[values['student_id']] = owner
+            if 'email' in values:
+                self.emails[values['email']] = owner
+        elif 'student_id' in values and values['student_id'] not in self.student_ids:
+            raise SyncError(f'Student {values["student_id"]} does not exist')
+
+    def _delete(self, entity, obj):
+        if entity != 'student':
+            db.session.delete(obj)
+            return
+        # Same path as DELETE /api/students/<id>: attendance and grades cascade in the database
+        db.session.flush()
+        log_student_deletes(Student.id == obj.id)
+        db.session.execute(db.delete(Student).where(Student.id == obj.id))
+        self.student_ids.discard(obj.id)
+        # Its attendance and grades are gone too
+        self.rows = {
+            (entity, id): row for (entity, id), row in self.rows.items()
+            if row is not obj and (entity == 'student' or row.student_id != obj.id)
+        }
+
+def parse_request(data):
+    token = data.get('token')
+    if token is not None and (not isinstance(token, int) or token < 0):
+        raise SyncError('token must be a value returned by a previous sync')
+    changes = data.get('changes') or []
+    if not isinstance(changes, list):
+        raise SyncError('changes must be a list')
+    if len(changes) > MAX_CHANGES:
+        raise SyncError(f'At most {MAX_CHANGES} changes per sync')
+
+    for change in changes:
+        if not isinstance(change, dict) or change.get('entity') not in MODELS:
+            raise SyncError(f'entity must be one of {", ".join(MODELS)}')
+        if change.get('op') not in ('insert', 'update', 'delete'):
+            raise SyncError('op must be one of insert, update, delete')
+        if change.get('data') is not None and not isinstance(change['data'], dict):
+            raise SyncError('data must be an object of column values')
+        if change['op'] != 'insert':
+            if not isinstance(change.get('id'), int):
+                raise SyncError('update and delete need the row id')
+            # Rows are current as of the sync that delivered them unless the client says otherwise
+            change['base_version'] = change.get('base_version', token or 0)
+            if not isinstance(change['base_version'], int):
+                raise SyncError('base_version must be a sync token')
+    return token, changes
+
+def changed_rows(token, watermark):
+    if token is None:
+        # First sync: everything in the open terms
+        return {entity: {
+            'upserted': [
+                {column.name: _encode(value) for column, value in zip(model.__table__.columns, row)}
+                for row in db.session.execute(db.select(*model.__table__.columns).order_by(model.id))
+            ],
+            'deleted': []
+        } for entity, model in MODELS.items()}
+
+    rows = {}
+    for entity in MODELS:
+        changes = changes_since(entity, token, watermark)
+        rows[entity] = {
+            'upserted': [row for operation, row in changes if operation != 'delete'],
+            'deleted': [row['id'] for operation, row in changes if operation == 'delete']
+        }
+    return rows
+
+def sync(user, data):
+    token, changes = parse_request(data)
+    batch_id = data.get('batch_id')
+
+    stored = db.session.get(SyncBatch, str(batch_id)) if batch_id else None
+    if stored is not None:
+        if stored.user_id != user.id:
+            raise SyncError('batch_id already used')
+        results = stored.results
+    else:
+        results = ChangeBatch(user, changes).apply() if changes else []
+        if batch_id:
+            db.session.add(SyncBatch(id=str(batch_id), user_id=user.id, results=results))
+            db.session.execute(db.delete(SyncBatch).where(SyncBatch.applied_at < datetime.utcnow() - BATCH_RETENTION))
+        db.session.commit()
+
+    watermark = current_watermark()
+    if token is not None and token > watermark:
+        # Not a token from this database (restored backup, other school): start over
+        token = None
+    return {
+        'token': watermark,
+        'full': token is None,
+        'results': results,
+        'changes': changed_rows(token, watermark)
+    }
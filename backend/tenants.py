@@ -0,0 +1,73 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from flask import current_app, jsonify, request
+from auth import Auth
+from database import current_school
+
+# Multi-school deployments: every school listed in SCHOOLS gets its own database
+# (SCHOOL_DATABASE_URL with {school} filled in). Requests pick their school from
+# the JWT's school claim, or from the X-School header before login; tokens issued
+# by the default database carry no claim and belong to district administrators.
+
+SCHOOL_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def school_binds(config):
+    binds = {}
+    for school in config['SCHOOLS']:
+        if not SCHOOL_PATTERN.match(school):
+            raise ValueError(f'Invalid school id {school!r}; use letters, digits, "-" and "_"')
+        url = config['SCHOOL_DATABASE_URL'].format(school=school)
+        binds[school] = {'url': url} if url.startswith('sqlite') else {'url': url, 'pool_size': config['SHARD_POOL_SIZE']}
+        if url.startswith('sqlite:///'):
+            os.makedirs(os.path.dirname(url[len('sqlite:///'):]) or '.', exist_ok=True)
+    return binds
+
+def select_school():
+    # before_request hook; returns an error response when the school can't be used
+    if not current_app.config['SCHOOLS']:
+        current_school.set(None)
+        return None
+
+    requested = request.headers.get('X-School') or request.args.get('school')
+    school = requested
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        claims = Auth.decode_claims(auth_header[len('Bearer '):], current_app.config['SECRET_KEY'])
+        if claims is not None:
+            school = claims.get('school')
+            if requested and requested != school:
+                return jsonify({'message': 'Token does not belong to this school'}), 403
+
+    if school is not None and school not in current_app.config['SCHOOLS']:
+        return jsonify({'message': 'Unknown school'}), 404
+    # Always set: worker threads are reused and would otherwise keep the previous request's school
+    current_school.set(school)
+    return None
+
+@contextmanager
+def school_context(app, school):
+    # An app context (and so a session of its own) bound to one school's database
+    token = current_school.set(school)
+    try:
+        with app.app_context():
+            yield
+    finally:
+        current_school.reset(token)
+
+def school_dir(path):
+    # Per-school subdirectory for files kept next to the database (archives, reports, snapshots)
+    school = current_school.get()
+    return os.path.join(path, school) if school else path
+
+def fan_out(app, work):
+    # Runs work() against every school's database in parallel; {school: result}
+    schools = app.config['SCHOOLS']
+
+    def run(school):
+        with school_context(app, school):
+            return work()
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(schools), app.config['SHARD_FANOUT_THREADS']))) as pool:
+        return dict(zip(schools, pool.map(run, schools)))
@@ -32,7 +32,8 @@ api.interceptors.response.use(
 );
 
 export const authAPI = {
-  login: (username, password) => api.post('/auth/login', { username, password }),
+  // school is only needed on multi-school deployments; the returned token carries it afterwards
+  login: (username, password, school) => api.post('/auth/login', { username, password }, school ? { headers: { 'X-School': school } } : undefined),
   register: (userData) => api.post('/auth/register', userData),
 };
 
@@ -46,9 +47,11 @@ export const userAPI = {
 export const studentAPI = {
   getAll: () => api.get('/students'),
   getOne: (id) => api.get(`/students/${id}`),
+  getOverview: (id, recent) => api.get(`/students/${id}/overview`, { params: { recent } }),
   create: (studentData) => api.post('/students', studentData),
   update: (id, studentData) => api.put(`/students/${id}`, studentData),
   delete: (id) => api.delete(`/students/${id}`),
+  deleteByClass: (className) => api.delete('/students', { params: { class_name: className } }),
 };
 
 export const attendanceAPI = {
@@ -57,6 +60,7 @@ export const attendanceAPI = {
   update: (id, attendanceData) => api.put(`/attendance/${id}`, attendanceData),
   delete: (id) => api.delete(`/attendance/${id}`),
   bulkMark: (bulkData) => api.post('/attendance/bulk', bulkData),
+  register: (params) => api.get('/attendance/register', { params }),
 };
 
 export const gradesAPI = {
@@ -69,6 +73,32 @@ export const gradesAPI = {
 export const analyticsAPI = {
   attendanceSummary: (params) => api.get('/analytics/attendance-summary', { params }),
   gradesSummary: (params) => api.get('/analytics/grades-summary', { params }),
+  attendanceTrend: (params) => api.get('/analytics/attendance-trend', { params }),
+  absenceAlerts: (params) => api.get('/analytics/absence-alerts', { params }),
+  gradeRankings: (params) => api.get('/analytics/grade-rankings', { params }),
+};
+
+export const reportAPI = {
+  create: (data) => api.post('/reports', data),
+  get: (id) => api.get(`/reports/${id}`),
+  getClass: (id, className) => api.get(`/reports/${id}/classes/${encodeURIComponent(className)}`),
+};
+
+export const termGradeAPI = {
+  getByStudent: (studentId, termId) => api.get(`/students/${studentId}/term-grades`, { params: { term_id: termId } }),
+  getReport: (params) => api.get('/analytics/term-grades', { params }),
+  getWeights: () => api.get('/grade-weights'),
+  updateWeights: (data) => api.put('/grade-weights', data),
+};
+
+export const syncAPI = {
+  sync: (data) => api.post('/sync', data),
+};
+
+export const districtAPI = {
+  getSchools: () => api.get('/schools'),
+  getSummary: (params) => api.get('/schools/analytics/summary', { params }),
+  getAttendanceTrend: (params) => api.get('/schools/analytics/attendance-trend', { params }),
 };
 
 export const exportAPI = {
@@ -76,3 +106,9 @@ export const exportAPI = {
   attendance: () => api.get('/export/attendance', { responseType: 'blob' }),
   grades: () => api.get('/export/grades', { responseType: 'blob' }),
 };
+
+export const termAPI = {
+  getAll: () => api.get('/terms'),
+  create: (termData) => api.post('/terms', termData),
+  archive: (id) => api.post(`/terms/${id}/archive`),
+};
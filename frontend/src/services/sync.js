@@ -0,0 +1,69 @@
+import { syncAPI } from './api';
+
+// The server's per-request limit (sync.MAX_CHANGES)
+const MAX_BATCH = 500;
+
+// Local copy of students, attendance and grades plus a queue of writes made while
+// offline. sync() sends the queue with the last token and merges the rows that
+// changed since then, so repeat visits don't refetch the full lists.
+class SyncService {
+  constructor() {
+    const saved = JSON.parse(localStorage.getItem('sync') || 'null');
+    this.token = saved?.token ?? null;
+    this.rows = saved?.rows || { student: {}, attendance: {}, grade: {} };
+    this.queue = saved?.queue || [];
+    // { id, changes } sent but not yet acknowledged
+    this.batch = saved?.batch || null;
+  }
+
+  save() {
+    localStorage.setItem('sync', JSON.stringify({ token: this.token, rows: this.rows, queue: this.queue, batch: this.batch }));
+  }
+
+  // change: { entity, op: 'insert' | 'update' | 'delete', id?, data? }
+  enqueue(change) {
+    this.queue.push({ ...change, client_id: change.client_id ?? crypto.randomUUID(), base_version: this.token ?? 0 });
+    this.save();
+  }
+
+  list(entity) {
+    return Object.values(this.rows[entity]);
+  }
+
+  async sync() {
+    // A batch and its changes survive a lost response and are resent exactly as they were,
+    // so the server never applies them twice; changes enqueued since wait for the next batch
+    if (!this.batch && this.queue.length) {
+      this.batch = { id: crypto.randomUUID(), changes: this.queue.slice(0, MAX_BATCH) };
+      this.queue = this.queue.slice(MAX_BATCH);
+      this.save();
+    }
+
+    const { data } = await syncAPI.sync({
+      token: this.token,
+      batch_id: this.batch?.id ?? null,
+      changes: this.batch?.changes ?? [],
+    });
+    if (data.full) {
+      this.rows = { student: {}, attendance: {}, grade: {} };
+    }
+    for (const [entity, { upserted, deleted }] of Object.entries(data.changes)) {
+      upserted.forEach((row) => { this.rows[entity][row.id] = row; });
+      deleted.forEach((id) => { delete this.rows[entity][id]; });
+    }
+    this.batch = null;
+    this.token = data.token;
+    this.save();
+    return data.results.filter((result) => result.status !== 'applied');
+  }
+
+  clear() {
+    localStorage.removeItem('sync');
+    this.token = null;
+    this.rows = { student: {}, attendance: {}, grade: {} };
+    this.queue = [];
+    this.batch = null;
+  }
+}
+
+export default new SyncService();